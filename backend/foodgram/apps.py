@@ -0,0 +1,20 @@
+from django.apps import AppConfig
+
+
+class FoodgramConfig(AppConfig):
+    """Проектные обработчики, не зависящие от приложений recipes и users."""
+    name = 'foodgram'
+
+    def ready(self):
+        from django.core import checks
+        from django.core.signals import request_started
+
+        from .caches import check_shared_caches
+        from .db import check_connections
+
+        checks.register(
+            check_shared_caches, checks.Tags.caches, deploy=True
+        )
+        request_started.connect(
+            check_connections, dispatch_uid='foodgram_check_connections'
+        )
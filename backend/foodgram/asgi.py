@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from foodgram import startup
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
 
-application = get_asgi_application()
+startup.import_modules()
+with startup.step('django setup'):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+startup.warm_up()
@@ -0,0 +1,85 @@
+"""
+Кэши, через которые воркеры узнают об изменениях друг друга: версии
+карточек рецептов, моделей, индексов и токенов. Кэш в памяти процесса
+(LocMemCache) для них не подходит — сброс версии в одном воркере
+не виден остальным, и они отдают устаревшие данные до истечения
+таймаута. При нескольких воркерах gunicorn такие кэши должны быть общими
+(redis или memcached).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache,)
+
+# (настройка с алиасом кэша или None для default, что в нём хранится
+# [, настройка, без которой кэш не используется])
+SHARED_CACHES = [
+    ('RECIPE_CACHE_ALIAS', 'версии и поколение карточек рецептов'),
+    (None, 'версия индекса ингредиентов'),
+    (None, 'версия индекса тегов'),
+    (None, 'версии моделей для ETag и Last-Modified'),
+    ('RESPONSE_CACHE_ALIAS', 'готовые ответы на сутки'),
+    ('TOKEN_AUTH_CACHE_ALIAS', 'версии токенов', 'TOKEN_AUTH_CACHE'),
+]
+
+
+def is_process_local(alias):
+    return isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
+
+
+def required_aliases():
+    """{алиас: [что в нём хранится]} для кэшей, которые должны быть общими."""
+    aliases = {}
+    for setting, purpose, *enabled_by in SHARED_CACHES:
+        if enabled_by and not getattr(settings, enabled_by[0]):
+            continue
+        alias = getattr(settings, setting, 'default') if setting else 'default'
+        aliases.setdefault(alias, []).append(purpose)
+    return aliases
+
+
+def process_local_caches():
+    """Те из обязательных общих кэшей, что на деле живут в памяти процесса."""
+    return {
+        alias: purposes
+        for alias, purposes in required_aliases().items()
+        if is_process_local(alias)
+    }
+
+
+def describe(local):
+    return '; '.join(
+        f'{alias} ({", ".join(purposes)})' for alias, purposes in local.items()
+    )
+
+
+def check_shared_caches(app_configs, **kwargs):
+    from django.core.checks import Warning
+
+    local = process_local_caches()
+    if not local:
+        return []
+    return [Warning(
+        'Кэши в памяти процесса там, где нужен общий: ' + describe(local),
+        hint=(
+            'Для нескольких воркеров задайте CACHE_BACKEND/CACHE_LOCATION '
+            'и RESPONSE_CACHE_BACKEND/RESPONSE_CACHE_LOCATION (redis, '
+            'memcached); с одним процессом предупреждение можно игнорировать.'
+        ),
+        id='foodgram.W001',
+    )]
+
+
+def ensure_shared(workers):
+    """
+    Не даёт запустить несколько воркеров с кэшами в памяти процесса:
+    каждый воркер видел бы только свои сбросы версий.
+    """
+    local = process_local_caches()
+    if workers > 1 and local:
+        raise RuntimeError(
+            f'{workers} воркеров не могут делить кэши в памяти процесса: '
+            f'{describe(local)}. Настройте общий кэш (redis, memcached) '
+            'или запустите один воркер.'
+        )
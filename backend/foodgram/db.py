@@ -0,0 +1,115 @@
+"""
+Постоянные соединения с базой и их бюджет. Модуль импортируется
+из конфигов gunicorn, поэтому Django здесь подключается только внутри
+функций.
+"""
+import multiprocessing
+import os
+
+
+def server_interface():
+    return os.getenv('SERVER_INTERFACE', 'wsgi')
+
+
+def configured_workers():
+    cpus = multiprocessing.cpu_count()
+    default = cpus if server_interface() == 'asgi' else cpus * 2 + 1
+    return int(os.getenv('GUNICORN_WORKERS', default))
+
+
+def configured_threads():
+    return int(os.getenv('GUNICORN_THREADS', 1))
+
+
+class HealthCheckMixin:
+    """
+    Ленивая проверка постоянного соединения (CONN_HEALTH_CHECKS
+    из Django 4.1): соединение, оборванное базой или pgbouncer, проверяется
+    один раз за запрос перед первым курсором и закрывается до того, как
+    запрос на нём упадёт. Запросы без обращения к базе проверку не платят.
+    """
+    health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None
+                or not self.settings_dict.get('CONN_HEALTH_CHECKS')
+                or self.health_check_done
+                or self.in_atomic_block):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def connect(self):
+        super().connect()
+        # Только что открытое соединение проверять незачем.
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+
+def check_connections(**kwargs):
+    """
+    Начало запроса: постоянные соединения снова требуют проверки, которую
+    HealthCheckMixin выполнит перед первым запросом к базе.
+    """
+    from django.db import connections
+
+    for connection in connections.all():
+        if isinstance(connection, HealthCheckMixin):
+            connection.health_check_done = False
+
+
+def connection_budget(workers=None, threads=None):
+    """
+    Сколько соединений может открыть один процесс и все воркеры вместе.
+    Под WSGI соединение живёт в потоке воркера; под ASGI каждый запрос
+    выполняется в своём потоке, поэтому соединения не переиспользуются
+    и их число равно числу одновременных запросов.
+    """
+    from django.conf import settings
+    from django.db import connections
+
+    workers = workers or configured_workers()
+    threads = threads or configured_threads()
+    aliases = len(settings.DATABASES)
+    budget = {
+        'interface': server_interface(),
+        'workers': workers,
+        'per_process': threads * aliases,
+        'total': workers * threads * aliases,
+        'conn_max_age': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+        'pgbouncer': settings.DB_PGBOUNCER,
+        'limit': settings.DB_MAX_CONNECTIONS,
+    }
+    connection = connections['default']
+    if budget['limit'] is None and connection.vendor == 'postgresql' \
+            and not settings.DB_PGBOUNCER:
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            budget['limit'] = int(cursor.fetchone()[0])
+    return budget
+
+
+def format_budget(budget):
+    if budget['interface'] == 'asgi':
+        per_process = 'по одному на одновременный запрос'
+        total = 'не ограничено конфигурацией'
+    else:
+        per_process, total = budget['per_process'], budget['total']
+    lines = [
+        f'соединения с БД: {per_process} на процесс, '
+        f'{budget["workers"]} воркеров, всего {total} '
+        f'(CONN_MAX_AGE={budget["conn_max_age"]}, '
+        f'pgbouncer={"да" if budget["pgbouncer"] else "нет"}, '
+        f'лимит={budget["limit"] or "неизвестен"})'
+    ]
+    if (budget['interface'] == 'wsgi' and budget['limit']
+            and budget['total'] > budget['limit']):
+        lines.append(
+            f'ВНИМАНИЕ: воркерам может понадобиться {budget["total"]} '
+            f'соединений при лимите {budget["limit"]}'
+        )
+    return lines
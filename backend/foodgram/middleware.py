@@ -0,0 +1,113 @@
+import logging
+import re
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('foodgram.queries')
+
+IN_LIST = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL без значений: одинаковые запросы с разными параметрами совпадают."""
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = LITERALS.sub('?', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """execute_wrapper, который считает запросы и время в базе."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.by_sql = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            entry = self.by_sql[sql]
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def fingerprints(self):
+        grouped = defaultdict(lambda: [0, 0.0])
+        for sql, (count, duration) in self.by_sql.items():
+            entry = grouped[fingerprint(sql)]
+            entry[0] += count
+            entry[1] += duration
+        return grouped
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает SQL-запросы и время в базе для запросов к /api/. Сотрудникам
+    отдаёт заголовки Server-Timing и X-Query-Count, медленные запросы
+    и повторы одного запроса (N+1) пишет в лог. Выключенный
+    (QUERY_INSTRUMENTATION=False) исключается из цепочки при запуске.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(settings.QUERY_INSTRUMENTATION_PREFIX):
+            return self.get_response(request)
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['X-Query-Count'] = str(stats.count)
+            response['Server-Timing'] = (
+                f'db;dur={stats.duration * 1000:.1f};'
+                f'desc="{stats.count} queries", '
+                f'app;dur={(total - stats.duration) * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}'
+            )
+        self.report(request, stats, total)
+        return response
+
+    def report(self, request, stats, total):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        fingerprints = stats.fingerprints()
+        for sql, (count, duration) in fingerprints.items():
+            if count >= settings.N_PLUS_ONE_THRESHOLD:
+                logger.warning(
+                    'Возможный N+1 в %s: запрос выполнен %d раз (%.1f мс): %s',
+                    view, count, duration * 1000, sql[:500],
+                )
+        if total * 1000 < settings.SLOW_REQUEST_MS:
+            return
+        heaviest = sorted(
+            fingerprints.items(), key=lambda item: item[1][1], reverse=True
+        )[:3]
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.1f мс, в базе %.1f мс, '
+            'запросов %d%s',
+            request.method, request.get_full_path(), view, total * 1000,
+            stats.duration * 1000, stats.count,
+            ''.join(
+                f'\n  {count} × {duration * 1000:.1f} мс: {sql[:300]}'
+                for sql, (count, duration) in heaviest
+            ),
+        )
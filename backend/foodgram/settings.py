@@ -27,7 +27,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = ['*']
 
@@ -43,12 +43,14 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
+    'foodgram.apps.FoodgramConfig',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +62,24 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'foodgram.urls'
 
+# Счётчик SQL-запросов и времени в базе для /api/ (см. foodgram.middleware).
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', 'False') == 'True'
+QUERY_INSTRUMENTATION_PREFIX = '/api/'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram': {'handlers': ['console'], 'level': 'INFO'},
+        'recipes': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -89,10 +109,99 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Под ASGI запросы выполняются в разных потоках и постоянное
+        # соединение не переиспользуется, поэтому там по умолчанию 0.
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE',
+            0 if os.getenv('SERVER_INTERFACE') == 'asgi' else 60
+        )),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+        ),
     }
 }
 
+# В Django 4.0 нет CONN_HEALTH_CHECKS: обёртка над штатным бэкендом
+# PostgreSQL проверяет постоянное соединение перед первым запросом.
+if DATABASES['default']['ENGINE'] in (
+    'django.db.backends.postgresql',
+    'django.db.backends.postgresql_psycopg2',
+):
+    DATABASES['default']['ENGINE'] = 'foodgram.postgresql'
+
+# pgbouncer в режиме transaction: серверные курсоры (iterator() на
+# PostgreSQL) не переживают конец транзакции, поэтому отключаются.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'False') == 'True'
+if DB_PGBOUNCER:
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+DB_MAX_CONNECTIONS = (
+    int(os.getenv('DB_MAX_CONNECTIONS')) if os.getenv('DB_MAX_CONNECTIONS')
+    else None
+)
+
+# Через кэши воркеры узнают об изменениях друг друга (версии рецептов,
+# моделей, индексов), поэтому при нескольких воркерах они должны быть
+# общими: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и
+# CACHE_LOCATION=redis://redis:6379/0, для ответов — RESPONSE_CACHE_*
+# с redis://redis:6379/1, как в infra/docker-compose.yml.
+# LocMemCache по умолчанию годится только для одного процесса (runserver,
+# тесты), см. foodgram/caches.py.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'responses'),
+    },
+}
+
+RECIPE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 24 * 60 * 60))
+RESPONSE_CACHE_GZIP = os.getenv('RESPONSE_CACHE_GZIP', 'True') == 'True'
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+# Кэш «токен → пользователь»: LRU в памяти процесса, сверяемый с версиями
+# токенов в TOKEN_AUTH_CACHE_ALIAS; при TOKEN_AUTH_SHARED_CACHE записи
+# хранятся и в общем кэше, чтобы новые воркеры не шли в базу. Как и другие
+# версии, при нескольких воркерах этот кэш должен быть общим: иначе выход
+# в одном воркере не виден остальным (см. foodgram/caches.py).
+TOKEN_AUTH_CACHE = os.getenv('TOKEN_AUTH_CACHE', 'True') == 'True'
+TOKEN_AUTH_CACHE_ALIAS = os.getenv('TOKEN_AUTH_CACHE_ALIAS', 'default')
+TOKEN_AUTH_CACHE_SIZE = int(os.getenv('TOKEN_AUTH_CACHE_SIZE', 10_000))
+TOKEN_AUTH_CACHE_TTL = int(os.getenv('TOKEN_AUTH_CACHE_TTL', 5 * 60))
+TOKEN_AUTH_SHARED_CACHE = os.getenv(
+    'TOKEN_AUTH_SHARED_CACHE', 'False'
+) == 'True'
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Асинхронные обёртки для горячих GET-маршрутов; включается в asgi.py.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# process — пул процессов, sync — в запросе, off — не обрабатывать.
+IMAGE_PROCESSING = os.getenv('IMAGE_PROCESSING', 'process')
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+IMAGE_VARIANT_WIDTHS = tuple(
+    int(width) for width in
+    os.getenv('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(',')
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -130,8 +239,19 @@ USE_TZ = True
 STATIC_URL = 'backend_static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 
+STATICFILES_STORAGE = (
+    'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+)
+
 MEDIA_URL = 'backend_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_media')
+DEFAULT_FILE_STORAGE = 'recipes.storage.HashedMediaStorage'
+
+# Файлы, которые отдаются только после проверки прав: Django отвечает
+# заголовком X-Accel-Redirect, а сам файл отдаёт nginx из internal-локации.
+PROTECTED_MEDIA_URL = '/protected/'
+PROTECTED_MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_protected')
+USE_X_ACCEL_REDIRECT = os.getenv('USE_X_ACCEL_REDIRECT', 'False') == 'True'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -146,7 +266,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     "DEFAULT_PAGINATION_CLASS": "recipes.paginations.CustomPageNumberPagination",
     "PAGE_SIZE": 6,
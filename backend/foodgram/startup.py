@@ -0,0 +1,148 @@
+"""
+Прогрев приложения при запуске. С preload_app gunicorn выполняет его один
+раз в мастер-процессе, и воркеры получают готовые кэши при fork.
+"""
+import importlib
+import time
+from contextlib import contextmanager
+
+# Модули, которые можно импортировать до django.setup(); приложения
+# и модели импортируются внутри setup и учитываются в его шаге.
+HEAVY_MODULES = (
+    'django.db.models',
+    'rest_framework.serializers',
+    'rest_framework.generics',
+    'django_filters.rest_framework',
+    'PIL.Image',
+    'reportlab.pdfgen.canvas',
+)
+
+report = []
+
+
+@contextmanager
+def step(name):
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as exc:
+        # Прогрев только ускоряет первые запросы: недоступная база
+        # или шрифт не должны мешать запуску.
+        error = exc
+    report.append((name, time.perf_counter() - started, error))
+
+
+def import_modules():
+    for module in HEAVY_MODULES:
+        with step(f'import {module}'):
+            importlib.import_module(module)
+
+
+def populate_urls():
+    from django.urls import get_resolver, resolve
+
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for path in ('/api/recipes/', '/api/tags/', '/api/users/me/'):
+        resolve(path)
+
+
+def build_serializer_fields():
+    from django.apps import apps
+    from rest_framework.serializers import ModelSerializer
+    from recipes import serializers as recipe_serializers
+    from users import serializers as user_serializers
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+    for module in (recipe_serializers, user_serializers):
+        for serializer in vars(module).values():
+            if (isinstance(serializer, type)
+                    and issubclass(serializer, ModelSerializer)
+                    and serializer.__module__ == module.__name__):
+                serializer(context={}).fields
+
+
+def render_tags():
+    from django.test import RequestFactory
+    from recipes.views import TagViewSet
+
+    view = TagViewSet.as_view({'get': 'list'})
+    for accept in ('application/json', '*/*'):
+        request = RequestFactory().get('/api/tags/', HTTP_ACCEPT=accept)
+        view(request).render()
+
+
+def warm_ingredient_index():
+    from recipes.ingredient_index import ingredient_index
+
+    ingredient_index.warm()
+
+
+def warm_tag_index():
+    from recipes.tag_index import tag_index
+
+    tag_index.warm()
+
+
+def register_pdf_font():
+    from recipes import shopping_list
+
+    shopping_list.register_pdf_font()
+
+
+WARM_UP_STEPS = (
+    ('url resolver', populate_urls),
+    ('serializer fields', build_serializer_fields),
+    ('tags', render_tags),
+    ('ingredient index', warm_ingredient_index),
+    ('tag index', warm_tag_index),
+    ('pdf font', register_pdf_font),
+)
+
+
+def warm_up():
+    from django.db import connections
+
+    for name, function in WARM_UP_STEPS:
+        with step(f'warm {name}'):
+            function()
+    # Соединения, открытые в мастере, нельзя делить между воркерами.
+    connections.close_all()
+
+
+def format_report():
+    total = sum(seconds for _, seconds, _ in report)
+    lines = ['Запуск приложения:']
+    for name, seconds, error in report:
+        status = f' (ошибка: {error})' if error else ''
+        lines.append(f'  {name:<40} {seconds * 1000:8.1f} мс{status}')
+    lines.append(f'  {"итого":<40} {total * 1000:8.1f} мс')
+    return lines
+
+
+def when_ready(server):
+    """
+    Хук gunicorn: печатает отчёт о запуске и бюджет соединений с базой
+    для фактического числа воркеров, затем замораживает GC перед fork.
+    """
+    import gc
+
+    from django.db import connections
+    from foodgram.caches import ensure_shared
+    from foodgram.db import connection_budget, format_budget
+
+    ensure_shared(server.cfg.workers)
+    for line in format_report():
+        server.log.info(line)
+    try:
+        budget = connection_budget(server.cfg.workers, server.cfg.threads)
+    except Exception as error:
+        server.log.warning('Не удалось оценить соединения с БД: %s', error)
+    else:
+        for line in format_budget(budget):
+            server.log.info(line)
+    finally:
+        connections.close_all()
+    gc.freeze()
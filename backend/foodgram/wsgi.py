@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+from foodgram import startup
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_wsgi_application()
+startup.import_modules()
+with startup.step('django setup'):
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+startup.warm_up()
@@ -0,0 +1,21 @@
+# Запуск: gunicorn -c gunicorn.conf.py
+import os
+
+from foodgram.db import configured_threads, configured_workers
+from foodgram.startup import when_ready  # noqa: F401
+
+wsgi_app = 'foodgram.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+# Число воркеров и потоков задаёт и бюджет соединений с базой:
+# см. отчёт о запуске.
+workers = configured_workers()
+threads = configured_threads()
+# Приложение загружается и прогревается в мастере, воркеры получают
+# его через fork и делят память copy-on-write.
+preload_app = True
+# Перезапуск воркеров ограничивает рост памяти; разброс не даёт
+# всем воркерам перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = 5
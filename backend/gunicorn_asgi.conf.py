@@ -0,0 +1,16 @@
+# Запуск: gunicorn -c gunicorn_asgi.conf.py
+import os
+
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
+
+from foodgram.db import configured_workers  # noqa: E402
+from foodgram.startup import when_ready  # noqa: E402, F401
+
+wsgi_app = 'foodgram.asgi:application'
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = configured_workers()
+preload_app = True
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+keepalive = 5
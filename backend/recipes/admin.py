@@ -40,9 +40,10 @@ class RecipeAdmin(admin.ModelAdmin):
         return user.email
 
     def favourite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     favourite_count.short_description = "Общее число добавлений в избранное"
+    favourite_count.admin_order_field = "favorites_count"
 
 
 class IngredientRecipeAdmin(admin.ModelAdmin):
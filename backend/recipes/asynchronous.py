@@ -0,0 +1,141 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import URLPattern
+from django.utils.cache import get_conditional_response
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import APIException
+
+from .conditional import (CachedResponseMixin, ConditionalGetMixin,
+                          aget_model_versions)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class PreparedAuthentication(BaseAuthentication):
+    """
+    Пользователь, которого async_read_view уже аутентифицировал штатными
+    классами DRF: исходное представление не проверяет токен второй раз.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        return getattr(request, 'prepared_auth', None)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+def with_prepared_authentication(view):
+    """
+    То же представление, но аутентификация — PreparedAuthentication,
+    а троттлинг уже пройден в prepare_view и второй раз не считается.
+    """
+    initkwargs = dict(
+        view.initkwargs,
+        authentication_classes=(PreparedAuthentication,),
+        throttle_classes=(),
+    )
+    actions = getattr(view, 'actions', None)
+    if actions is None:
+        return view.cls.as_view(**initkwargs)
+    return view.cls.as_view(actions, **initkwargs)
+
+
+def prepare_view(view, request, args, kwargs):
+    """
+    Синхронная часть DRF: создаёт экземпляр представления, проводит
+    аутентификацию, проверку прав и троттлинг. None — если запрос нужно
+    целиком отдать исходному представлению (например, ради ответа 401).
+    """
+    instance = view.cls(**view.initkwargs)
+    actions = getattr(view, 'actions', None)
+    if actions is not None:
+        actions = dict(actions)
+        if 'get' in actions and 'head' not in actions:
+            actions['head'] = actions['get']
+        instance.action_map = actions
+    instance.args, instance.kwargs = args, kwargs
+    drf_request = instance.initialize_request(request, *args, **kwargs)
+    instance.request = drf_request
+    instance.format_kwarg = instance.get_format_suffix(**kwargs)
+    try:
+        instance.perform_authentication(drf_request)
+        instance.check_permissions(drf_request)
+        instance.check_throttles(drf_request)
+    except APIException:
+        return None
+    return instance
+
+
+async def early_response(instance, request):
+    """
+    Проверка ETag и кэша ответов без обращения к базе: версии моделей
+    и готовые ответы читаются асинхронным API кэша.
+    """
+    drf_request = instance.request
+    if (not isinstance(instance, ConditionalGetMixin)
+            or not instance.should_check_conditions(drf_request)):
+        return None
+    versions = await aget_model_versions(instance.etag_models)
+    instance.validators = instance.build_validators(drf_request, versions)
+    etag, last_modified = instance.validators
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if (response is None and isinstance(instance, CachedResponseMixin)
+            and instance.should_cache_response()):
+        cached = await instance.get_response_cache().aget(
+            instance.response_cache_key()
+        )
+        if cached is not None:
+            response = instance.build_cached_response(request, cached)
+    if response is not None and response.status_code in (200, 304):
+        instance.patch_validators(response)
+    return response
+
+
+def async_read_view(view):
+    """
+    Асинхронная обёртка над DRF-представлением для ASGI. Безопасные
+    запросы, на которые хватает ETag или кэша ответов, обслуживаются
+    в event loop; остальные уходят в исходное представление в потоке
+    запроса, уже с аутентифицированным пользователем.
+    """
+    prepared_view = with_prepared_authentication(view)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            instance = await sync_to_async(prepare_view)(
+                view, request, args, kwargs
+            )
+            if instance is not None:
+                response = await early_response(instance, request)
+                if response is not None:
+                    return response
+                if instance.request.user.is_authenticated:
+                    request.prepared_auth = (
+                        instance.request.user, instance.request.auth
+                    )
+                return await sync_to_async(prepared_view)(
+                    request, *args, **kwargs
+                )
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_read_patterns(patterns, names):
+    """Заменяет представления с указанными именами маршрутов на async."""
+    if not settings.ASYNC_READ_VIEWS:
+        return list(patterns)
+    return [
+        URLPattern(
+            pattern.pattern, async_read_view(pattern.callback),
+            pattern.default_args, pattern.name,
+        )
+        if getattr(pattern, 'name', None) in names else pattern
+        for pattern in patterns
+    ]
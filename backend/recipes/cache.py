@@ -0,0 +1,143 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'recipes:payload:generation'
+VERSION_KEY = 'recipes:payload:version:{}'
+PAYLOAD_KEY = 'recipes:payload:{}:{}:{}:{}'
+HITS_KEY = 'recipes:payload:hits'
+MISSES_KEY = 'recipes:payload:misses'
+
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_cache():
+    return caches[getattr(settings, 'RECIPE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'RECIPE_CACHE_TIMEOUT', 60 * 60)
+
+
+def _initial_version():
+    # Версия, потерянная кэшем, не должна совпасть с уже записанной,
+    # поэтому начинаем отсчёт с текущего времени, а не с единицы.
+    return time.time_ns()
+
+
+def _incr(cache, key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def _count(cache, key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, None)
+
+
+def get_generation(cache=None):
+    cache = cache or get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _initial_version(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    _incr(get_cache(), GENERATION_KEY)
+
+
+def bump_recipes(recipe_ids):
+    cache = get_cache()
+    for recipe_id in set(recipe_ids):
+        _incr(cache, VERSION_KEY.format(recipe_id))
+
+
+def bump_recipes_on_commit(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: bump_recipes(recipe_ids))
+
+
+def get_versions(recipe_ids, cache=None):
+    cache = cache or get_cache()
+    version_keys = {
+        recipe_id: VERSION_KEY.format(recipe_id) for recipe_id in recipe_ids
+    }
+    versions = cache.get_many(version_keys.values())
+    missing = {
+        key: _initial_version()
+        for key in version_keys.values() if key not in versions
+    }
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(missing))
+    return get_generation(cache), {
+        recipe_id: versions.get(key)
+        for recipe_id, key in version_keys.items()
+    }
+
+
+def _payload_keys(cache, recipe_ids, base_url):
+    generation, versions = get_versions(recipe_ids, cache)
+    return {
+        recipe_id: PAYLOAD_KEY.format(generation, base_url, recipe_id, version)
+        for recipe_id, version in versions.items()
+    }
+
+
+def get_payloads(recipe_ids, base_url):
+    cache = get_cache()
+    keys = _payload_keys(cache, recipe_ids, base_url)
+    found = cache.get_many(keys.values())
+    payloads = {
+        recipe_id: found[key] for recipe_id, key in keys.items()
+        if key in found
+    }
+    _count(cache, HITS_KEY, len(payloads))
+    _count(cache, MISSES_KEY, len(keys) - len(payloads))
+    return payloads, keys
+
+
+def set_payloads(payloads, keys):
+    if not payloads:
+        return
+    get_cache().set_many(
+        {keys[recipe_id]: data for recipe_id, data in payloads.items()},
+        get_timeout()
+    )
+
+
+def strip_user_fields(data):
+    data = dict(data)
+    for field in USER_FIELDS:
+        data[field] = False
+    if data.get('author'):
+        data['author'] = dict(data['author'], is_subscribed=False)
+    return data
+
+
+def get_stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,224 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.text import compress_string
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+# Версии моделей хранятся в кэше default: он должен быть общим для всех
+# воркеров, иначе изменение в одном не меняет ETag в остальных
+# (см. foodgram/caches.py).
+VERSION_KEY = 'versions:{}'
+
+
+def _label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def bump_model_version(*models):
+    # Версия — время последнего изменения в наносекундах: из неё же
+    # получается Last-Modified.
+    now = time.time_ns()
+    cache.set_many(
+        {VERSION_KEY.format(_label(model)): now for model in models}, None
+    )
+
+
+def bump_model_version_on_commit(*models):
+    transaction.on_commit(lambda: bump_model_version(*models))
+
+
+def get_model_versions(models):
+    keys = [VERSION_KEY.format(_label(model)) for model in models]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return [versions[key] for key in keys]
+
+
+async def aget_model_versions(models):
+    keys = [VERSION_KEY.format(_label(model)) for model in models]
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            await cache.aadd(key, now, None)
+        versions.update(await cache.aget_many(missing))
+    return [versions[key] for key in keys]
+
+
+class EarlyResponse(APIException):
+    """Готовый ответ, который нужно отдать, не вызывая обработчик."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified для безопасных запросов по версиям моделей.
+    Ответ 304 отдаётся сразу после аутентификации, до сериализации.
+    """
+    etag_models = ()
+    etag_actions = None
+    etag_per_user = False
+
+    def should_check_conditions(self, request):
+        if request.method not in ('GET', 'HEAD') or not self.etag_models:
+            return False
+        action = getattr(self, 'action', None)
+        return self.etag_actions is None or action in self.etag_actions
+
+    def get_validators(self, request):
+        return self.build_validators(
+            request, get_model_versions(self.etag_models)
+        )
+
+    def build_validators(self, request, versions):
+        user = request.user
+        parts = [
+            type(self).__name__,
+            request.get_full_path(),
+            request.headers.get('Accept', ''),
+            str(user.pk if self.etag_per_user and user.is_authenticated
+                else ''),
+        ] + [str(version) for version in versions]
+        etag = quote_etag(
+            hashlib.sha1('|'.join(parts).encode()).hexdigest()
+        )
+        return etag, self.get_last_modified(versions)
+
+    @staticmethod
+    def get_last_modified(versions):
+        # Last-Modified точен до секунды. Пока секунда последнего изменения
+        # не закончилась, следующее изменение получит то же значение,
+        # и If-Modified-Since ответил бы 304 на устаревшие данные, поэтому
+        # дата отдаётся только за уже закончившиеся секунды.
+        last_modified = max(versions) // 10 ** 9 + 1
+        if time.time_ns() < last_modified * 10 ** 9:
+            return None
+        return last_modified
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if not self.should_check_conditions(request):
+            return
+        self.validators = self.get_validators(request)
+        etag, last_modified = self.validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            raise EarlyResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, EarlyResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if response.status_code in (200, 304):
+            self.patch_validators(response)
+        return response
+
+    def patch_validators(self, response):
+        validators = getattr(self, 'validators', None)
+        if not validators:
+            return
+        etag, last_modified = validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = (
+            'private, no-cache' if self.etag_per_user
+            else 'public, no-cache'
+        )
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+
+
+class CachedResponseMixin(ConditionalGetMixin):
+    """
+    Кэширует отрендеренные ответы на общие для всех запросы.
+    Ключ — ETag, поэтому изменение моделей из etag_models делает
+    старые записи недостижимыми без явной очистки. Кэш RESPONSE_CACHE_ALIAS
+    должен быть общим: в памяти процесса каждый воркер рендерит и сутки
+    хранит свою копию каждого ответа. Кэшируется только JSON: страница
+    BrowsableAPI содержит CSRF-токен и данные пользователя.
+    """
+    served_from_cache = False
+    cached_media_types = ('application/json',)
+
+    def get_response_cache(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def response_cache_key(self):
+        return f'response:{self.validators[0]}'
+
+    def should_cache_response(self):
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return (
+            getattr(self, 'validators', None) is not None
+            and not self.etag_per_user
+            and renderer is not None
+            and renderer.media_type in self.cached_media_types
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not self.should_cache_response():
+            return
+        cached = self.get_response_cache().get(self.response_cache_key())
+        if cached is not None:
+            self.served_from_cache = True
+            raise EarlyResponse(self.build_cached_response(request, cached))
+
+    def build_cached_response(self, request, cached):
+        content, content_type, compressed = cached
+        response = HttpResponse(content_type=content_type)
+        accepts_gzip = re_accepts_gzip.search(
+            request.headers.get('Accept-Encoding', '')
+        )
+        if compressed is not None and accepts_gzip:
+            response.content = compressed
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response.content = content
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (self.served_from_cache or not self.should_cache_response()
+                or response.status_code != 200
+                or not isinstance(response, Response)):
+            return response
+        response.render()
+        content = response.content
+        compressed = (
+            compress_string(content) if settings.RESPONSE_CACHE_GZIP
+            else None
+        )
+        self.get_response_cache().set(
+            self.response_cache_key(),
+            (content, response['Content-Type'], compressed),
+            settings.RESPONSE_CACHE_TIMEOUT,
+        )
+        return response
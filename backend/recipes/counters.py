@@ -0,0 +1,62 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель со счётчиком, поле счётчика, модель связи, поле связи)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'carts_count', 'recipes.ShoppingCart', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'author'),
+)
+
+
+def increment(model, pk, field, delta=1):
+    if pk is None or not delta:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def increment_many(model, pks, field, delta=1):
+    """increment для набора строк одним UPDATE."""
+    pks = list(pks)
+    if not pks or not delta:
+        return
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def actual_count(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(**{related_field: OuterRef('pk')})
+            .order_by()
+            .values(related_field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def rebuild_counters(apps=global_apps, dry_run=False):
+    drift = {}
+    for model_name, field, related_name, related_field in COUNTERS:
+        model = apps.get_model(model_name)
+        related_model = apps.get_model(related_name)
+        actual = actual_count(related_model, related_field)
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        )
+        drift[f'{model_name}.{field}'] = drifted.count()
+        if not dry_run and drift[f'{model_name}.{field}']:
+            model.objects.filter(
+                pk__in=drifted.values('pk')
+            ).update(**{field: actual})
+    return drift
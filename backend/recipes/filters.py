@@ -1,18 +1,45 @@
+from django import forms
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Value, When)
 from django_filters import rest_framework as rest_framework_filter
 from rest_framework.filters import SearchFilter
 
 from .models import Recipe
+from .tag_index import tag_index
 
 User = get_user_model()
 
+TAGS_MATCH_CHOICES = (("any", "любой из тегов"), ("all", "все теги"))
+
+
+class SlugListField(forms.Field):
+    """Повторяющийся параметр (?tags=a&tags=b) без проверки по choices."""
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class SlugListFilter(rest_framework_filter.Filter):
+    field_class = SlugListField
+
+
+def has_tag(tag_id):
+    return Exists(Recipe.tags.through.objects.filter(
+        recipe_id=OuterRef("pk"), tag_id=tag_id
+    ))
+
 
 class RecipeFilter(rest_framework_filter.FilterSet):
     author = rest_framework_filter.ModelChoiceFilter(
         queryset=User.objects.all()
     )
-    tags = rest_framework_filter.AllValuesMultipleFilter(
-        field_name="tags__slug"
+    tags = SlugListFilter(method="filter_tags")
+    tags_match = rest_framework_filter.ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES, method="filter_tags_match"
     )
     is_favorited = rest_framework_filter.BooleanFilter(
         method="filter_is_favorited"
@@ -20,6 +47,32 @@ class RecipeFilter(rest_framework_filter.FilterSet):
     is_in_shopping_cart = rest_framework_filter.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    search = rest_framework_filter.CharFilter(method="filter_search")
+
+    def filter_tags(self, queryset, name, value):
+        """
+        slug переводятся в id по tag_index, а совпадение проверяется
+        подзапросом EXISTS по (recipe_id, tag_id): без JOIN рецепты
+        не дублируются и DISTINCT не нужен. tags_match=all требует
+        все теги, по умолчанию достаточно любого.
+        """
+        if not value:
+            return queryset
+        tag_ids, all_known = tag_index.resolve(value)
+        if self.form.cleaned_data.get("tags_match") == "all":
+            if not all_known:
+                return queryset.none()
+            for tag_id in tag_ids:
+                queryset = queryset.filter(has_tag(tag_id))
+            return queryset
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef("pk"), tag_id__in=tag_ids
+        )))
+
+    def filter_tags_match(self, queryset, name, value):
+        return queryset
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -31,9 +84,35 @@ class RecipeFilter(rest_framework_filter.FilterSet):
             return queryset.filter(carts__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        if connection.vendor == "postgresql":
+            query = SearchQuery(
+                value, config="russian", search_type="websearch"
+            )
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F("search_vector"), query)
+            ).order_by("-rank", "-pub_date")
+        rank = Value(0)
+        for word in value.split():
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word)
+            )
+            rank += Case(
+                When(name__icontains=word, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        return queryset.annotate(rank=rank).order_by("-rank", "-pub_date")
+
     class Meta:
         model = Recipe
-        fields = ("author", "tags", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "author", "tags", "tags_match", "is_favorited",
+            "is_in_shopping_cart", "search",
+        )
 
 
 class IngredientFilter(SearchFilter):
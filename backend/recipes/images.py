@@ -0,0 +1,137 @@
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def build_variants(source, media_root, widths):
+    """
+    Уменьшает изображение до каждой из ширин и сохраняет webp и jpeg
+    без метаданных под именами с хэшем содержимого. Выполняется
+    в отдельном процессе, поэтому обходится без Django: получает
+    и возвращает только пути относительно media_root.
+    """
+    path = os.path.join(media_root, source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    folder = os.path.join(os.path.dirname(source), VARIANTS_DIR)
+    os.makedirs(os.path.join(media_root, folder), exist_ok=True)
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands()
+                                  else 'RGB')
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        sizes = sorted(
+            {min(width, image.width) for width in widths}
+        )
+        variants = {}
+        for width in sizes:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for extension, (file_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, file_format, **options)
+                digest = hashlib.sha256(buffer.getvalue()).hexdigest()[:8]
+                name = os.path.join(
+                    folder, f'{stem}_{width}.{digest}.{extension}'
+                )
+                with open(os.path.join(media_root, name), 'wb') as file:
+                    file.write(buffer.getvalue())
+                variants.setdefault(str(width), {})[extension] = name
+    return variants
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def store_variants(recipe_id, image_name, variants):
+    from .models import Recipe
+
+    recipe = Recipe.objects.filter(
+        pk=recipe_id, image=image_name
+    ).only('id', 'image', 'image_variants').first()
+    if recipe is None:
+        return
+    recipe.image_variants = variants
+    recipe.save(update_fields=('image_variants',))
+
+
+def _on_done(recipe_id, image_name, future):
+    try:
+        store_variants(recipe_id, image_name, future.result())
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', image_name)
+    finally:
+        connection.close()
+
+
+def process_recipe_image(recipe_id, image_name, mode=None):
+    mode = mode or settings.IMAGE_PROCESSING
+    if mode == 'off' or not image_name:
+        return
+    args = (image_name, str(settings.MEDIA_ROOT),
+            tuple(settings.IMAGE_VARIANT_WIDTHS))
+    if mode == 'sync':
+        store_variants(recipe_id, image_name, build_variants(*args))
+        return
+    future = get_executor().submit(build_variants, *args)
+    future.add_done_callback(partial(_on_done, recipe_id, image_name))
+
+
+def schedule_recipe_image(recipe):
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: process_recipe_image(recipe_id, image_name)
+    )
+
+
+def get_srcset(recipe, request=None):
+    """
+    {формат: srcset} по готовым вариантам. Пока их нет, под ключом
+    original отдаётся исходный файл.
+    """
+    def absolute(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    if not recipe.image_variants:
+        return {'original': absolute(recipe.image.name)} if recipe.image \
+            else {}
+    sources = {}
+    for width, files in sorted(
+            recipe.image_variants.items(), key=lambda item: int(item[0])):
+        for extension, name in files.items():
+            sources.setdefault(extension, []).append(
+                f'{absolute(name)} {width}w'
+            )
+    return {
+        extension: ', '.join(items) for extension, items in sources.items()
+    }
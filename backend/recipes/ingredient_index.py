@@ -0,0 +1,107 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from .models import Ingredient
+
+VERSION_KEY = 'recipes:ingredients:version'
+
+
+def normalize(value):
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex:
+    """
+    Отсортированный по нормализованному названию список ингредиентов
+    в памяти процесса: префиксный поиск бинарным, затем вхождения подстроки.
+    Сверяется с версией в кэше default; другие воркеры видят сброс, только
+    если этот кэш общий (см. foodgram/caches.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._version = None
+
+    @property
+    def is_built(self):
+        return self._keys is not None
+
+    def build(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        rows = sorted(
+            (normalize(name), name, pk, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        keys = [row[0] for row in rows]
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, name, pk, unit in rows
+        ]
+        with self._lock:
+            self._keys, self._items = keys, items
+            self._version = version
+
+    def warm(self):
+        try:
+            self.build()
+        except DatabaseError:
+            self.invalidate(local_only=True)
+
+    def invalidate(self, local_only=False):
+        with self._lock:
+            self._keys = self._items = None
+        if not local_only:
+            try:
+                cache.incr(VERSION_KEY)
+            except ValueError:
+                # Потерянная кэшем версия не должна совпасть с той,
+                # с которой индекс уже построен в другом воркере.
+                cache.set(VERSION_KEY, time.time_ns(), None)
+
+    def _ensure_fresh(self):
+        if self._keys is None or cache.get(VERSION_KEY) != self._version:
+            self.build()
+        return self._keys, self._items
+
+    def all(self):
+        return self._ensure_fresh()[1]
+
+    def search(self, query, limit=None):
+        if limit is None:
+            limit = getattr(settings, 'INGREDIENT_SEARCH_LIMIT', 50)
+        keys, items = self._ensure_fresh()
+        query = normalize(query)
+        if not query:
+            return items[:limit]
+        result = []
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result.extend(items[start:min(end, start + limit)])
+        if len(result) >= limit:
+            return result
+        substring = sorted(
+            (key.find(query), index)
+            for index, key in enumerate(keys)
+            if not start <= index < end and query in key
+        )
+        result.extend(
+            items[index] for _, index in substring[:limit - len(result)]
+        )
+        return result
+
+
+ingredient_index = IngredientIndex()
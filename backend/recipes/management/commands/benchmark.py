@@ -0,0 +1,277 @@
+import base64
+import io
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from rest_framework.test import APIClient
+
+from foodgram.settings import BASE_DIR
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.seeding import DATASETS, seed
+from users.models import Follow, User
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def image_payload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), '#E26C2D').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Scenario:
+    """Данные, из которых строятся запросы: пользователь, id, теги."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.user = User.objects.filter(
+            pk__in=Follow.objects.values('user')
+        ).filter(
+            pk__in=ShoppingCart.objects.values('user')
+        ).order_by('pk').first() or User.objects.order_by('pk').first()
+        self.recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)
+        )
+        self.prefixes = sorted({
+            name[:2] for name in Ingredient.objects.values_list(
+                'name', flat=True
+            )[:200]
+        })
+        self.image = image_payload()
+        self.own_recipe = None
+
+    def recipe_body(self):
+        return {
+            'name': f'бенчмарк {self.rng.randint(0, 10 ** 6)}',
+            'text': 'Описание рецепта для бенчмарка',
+            'cooking_time': self.rng.randint(5, 120),
+            'image': self.image,
+            'tags': self.rng.sample(self.tag_ids, min(2, len(self.tag_ids))),
+            'ingredients': [
+                {'id': pk, 'amount': self.rng.randint(1, 500)}
+                for pk in self.rng.sample(self.ingredient_ids, 8)
+            ],
+        }
+
+    def endpoints(self):
+        """(имя, метод, функция → (путь, тело), авторизация)."""
+        return (
+            ('recipes_list', 'get', lambda: ('/api/recipes/', None), False),
+            ('recipes_by_tags', 'get', lambda: (
+                '/api/recipes/?' + '&'.join(
+                    f'tags={slug}'
+                    for slug in self.rng.sample(self.tag_slugs, 2)
+                ), None), False),
+            ('recipes_favorited', 'get', lambda: (
+                '/api/recipes/?is_favorited=1', None), True),
+            ('recipe_detail', 'get', lambda: (
+                f'/api/recipes/{self.rng.choice(self.recipe_ids)}/', None
+            ), False),
+            ('subscriptions', 'get', lambda: (
+                '/api/users/subscriptions/?recipes_limit=3', None), True),
+            ('download_shopping_cart', 'get', lambda: (
+                '/api/recipes/download_shopping_cart/', None), True),
+            ('ingredient_search', 'get', lambda: (
+                f'/api/ingredients/?name={self.rng.choice(self.prefixes)}',
+                None), False),
+            ('recipe_create', 'post', lambda: (
+                '/api/recipes/', self.recipe_body()), True),
+            ('recipe_update', 'patch', lambda: (
+                f'/api/recipes/{self.own_recipe}/', self.recipe_body()
+            ), True),
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет временную тестовую базу наборами данных разного размера '
+        'и замеряет эндпоинты внутри процесса: запросы в секунду, '
+        'p50/p95/p99 и число SQL-запросов. Результат сохраняется в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='small,medium',
+            help=f'Наборы данных через запятую: {", ".join(DATASETS)}',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only', help='Замерять только эти эндпоинты (через запятую)',
+        )
+        parser.add_argument('--output', help='Куда сохранить JSON')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения',
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу после запуска',
+        )
+
+    def handle(self, *args, **options):
+        sizes = options['sizes'].split(',')
+        unknown = set(sizes) - set(DATASETS)
+        if unknown:
+            raise CommandError(f'Неизвестные наборы данных: {unknown}')
+        if options['keepdb'] and len(sizes) > 1:
+            raise CommandError(
+                '--keepdb хранит одну тестовую базу: укажите один набор'
+            )
+        results = {'meta': self.meta(options), 'datasets': {}}
+        setup_test_environment(debug=False)
+        try:
+            for size in sizes:
+                results['datasets'][size] = self.run_dataset(size, options)
+        finally:
+            teardown_test_environment()
+        output = Path(options['output'] or (
+            f'benchmark-{results["meta"]["commit"][:8] or "local"}.json'
+        ))
+        output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+        if options['compare']:
+            self.compare(
+                json.loads(Path(options['compare']).read_text()), results
+            )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = ''
+        return {
+            'commit': commit,
+            'date': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': options['requests'],
+            'seed': options['seed'],
+        }
+
+    def run_dataset(self, size, options):
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'],
+        )
+        media = tempfile.TemporaryDirectory()
+        try:
+            with override_settings(
+                    MEDIA_ROOT=media.name, PROTECTED_MEDIA_ROOT=media.name,
+                    IMAGE_PROCESSING='off'):
+                started = time.perf_counter()
+                if not Recipe.objects.exists():
+                    seed(DATASETS[size], random_seed=options['seed'])
+                self.stdout.write(
+                    f'{size}: данные за {time.perf_counter() - started:.1f} с '
+                    f'(рецептов {Recipe.objects.count()}, '
+                    f'избранного {Favorite.objects.count()})'
+                )
+                return self.measure(options)
+        finally:
+            media.cleanup()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+
+    def measure(self, options):
+        for alias in ('default', 'responses'):
+            caches[alias].clear()
+        ingredient_index.invalidate()
+        scenario = Scenario(random.Random(options['seed']))
+        only = set(options['only'].split(',')) if options['only'] else None
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.force_authenticate(scenario.user)
+        response = authorized.post(
+            '/api/recipes/', scenario.recipe_body(), format='json'
+        )
+        scenario.own_recipe = response.json()['id']
+        stats = {}
+        for name, method, build, auth in scenario.endpoints():
+            if only and name not in only:
+                continue
+            client = authorized if auth else anonymous
+            stats[name] = self.measure_endpoint(
+                client, method, build, options
+            )
+            self.stdout.write(
+                f'  {name:<24} {stats[name]["rps"]:>8} rps  '
+                f'p50 {stats[name]["p50_ms"]:>7} мс  '
+                f'p99 {stats[name]["p99_ms"]:>7} мс  '
+                f'SQL {stats[name]["queries"]:>5}'
+            )
+        return stats
+
+    def measure_endpoint(self, client, method, build, options):
+        def call():
+            path, body = build()
+            response = getattr(client, method)(path, body, format='json')
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{method.upper()} {path}: {response.status_code}'
+                )
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+
+        for _ in range(options['warmup']):
+            call()
+        latencies, queries = [], 0
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                call()
+                latencies.append(time.perf_counter() - started)
+            queries += len(captured)
+        total = sum(latencies)
+        return {
+            'rps': round(len(latencies) / total, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries': round(queries / len(latencies), 1),
+        }
+
+    def compare(self, old, new):
+        self.stdout.write(
+            f'Сравнение с {old["meta"]["commit"][:8]} '
+            '(rps и p99, изменение в %):'
+        )
+        for size, endpoints in new['datasets'].items():
+            for name, stats in endpoints.items():
+                before = old['datasets'].get(size, {}).get(name)
+                if not before:
+                    continue
+                rps = (stats['rps'] / before['rps'] - 1) * 100
+                p99 = (stats['p99_ms'] / before['p99_ms'] - 1) * 100
+                self.stdout.write(
+                    f'  {size:<7} {name:<24} rps {rps:+7.1f}%  '
+                    f'p99 {p99:+7.1f}%  SQL {before["queries"]} → '
+                    f'{stats["queries"]}'
+                )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные варианты изображений рецептов, '
+        'для которых их ещё нет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='rebuild',
+            help='Перестроить варианты для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only('id', 'image')
+        if not options['rebuild']:
+            recipes = recipes.filter(image_variants={})
+        processed = failed = 0
+        for recipe in recipes.iterator():
+            try:
+                images.process_recipe_image(
+                    recipe.pk, recipe.image.name, mode='sync'
+                )
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{recipe.image.name}: {error}')
+            else:
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибкой: {failed}'
+        ))
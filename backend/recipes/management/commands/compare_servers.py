@@ -0,0 +1,216 @@
+import http.client
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.settings import BASE_DIR
+
+DEFAULT_PATHS = (
+    '/api/recipes/', '/api/recipes/?page=2', '/api/tags/',
+    '/api/ingredients/?name=а',
+)
+SERVERS = {
+    'wsgi': ('foodgram.wsgi:application', 'sync'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+
+
+def rss_mb(pid):
+    """Память процесса и всех его потомков по /proc (только Linux)."""
+    parents = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            status = (entry / 'status').read_text()
+        except OSError:
+            continue
+        fields = dict(
+            line.split(':', 1) for line in status.splitlines() if ':' in line
+        )
+        parents[int(entry.name)] = (
+            int(fields.get('PPid', '0')),
+            int(fields.get('VmRSS', '0 kB').split()[0]),
+        )
+    tree, total = {pid}, 0
+    changed = True
+    while changed:
+        changed = False
+        for child, (parent, _) in parents.items():
+            if parent in tree and child not in tree:
+                tree.add(child)
+                changed = True
+    for member in tree:
+        total += parents.get(member, (0, 0))[1]
+    return round(total / 1024, 1)
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает WSGI (sync-воркеры gunicorn) и ASGI (uvicorn-воркеры) '
+        'под одинаковой нагрузкой: запросы в секунду, задержки и память'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-workers', type=int, default=4)
+        parser.add_argument('--asgi-workers', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--port', type=int, default=8101)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Запрашиваемый путь; можно указать несколько раз',
+        )
+        parser.add_argument(
+            '--token', help='Токен для заголовка Authorization',
+        )
+        parser.add_argument(
+            '--revalidate', action='store_true',
+            help='Повторять запросы с If-None-Match, как браузер с кэшем',
+        )
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        paths = [
+            quote(path, safe='/?=&')
+            for path in options['paths'] or DEFAULT_PATHS
+        ]
+        headers = {'Connection': 'keep-alive'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        results = {}
+        for kind, (app, worker_class) in SERVERS.items():
+            workers = options[f'{kind}_workers']
+            process = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'gunicorn', app,
+                    '--worker-class', worker_class,
+                    '--workers', str(workers),
+                    '--bind', f'127.0.0.1:{options["port"]}',
+                    '--log-level', 'warning',
+                ],
+                cwd=BASE_DIR, env=dict(os.environ),
+            )
+            try:
+                self.wait_ready(options['port'], paths, headers)
+                memory = rss_mb(process.pid)
+                stats = self.load(
+                    options['port'], paths, headers,
+                    options['concurrency'], options['duration'],
+                    options['revalidate'],
+                )
+                stats['rss_mb'] = max(memory, rss_mb(process.pid))
+                stats['workers'] = workers
+                # Число воркеров задаётся вручную, поэтому память у серверов
+                # разная: пропускная способность на 100 МБ сравнима и так.
+                stats['rps_per_100mb'] = round(
+                    stats['rps'] * 100 / stats['rss_mb'], 1
+                ) if stats['rss_mb'] else 0.0
+                results[kind] = stats
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=30)
+        self.report(results)
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(results, indent=2, ensure_ascii=False)
+            )
+
+    def wait_ready(self, port, paths, headers, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                for path in paths:
+                    connection.request('GET', path, headers=headers)
+                    connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Сервер на порту {port} не запустился')
+
+    def load(self, port, paths, headers, concurrency, duration,
+             revalidate=False):
+        latencies, errors = [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            own, failed, index, etags = [], 0, offset, {}
+            while time.monotonic() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                request_headers = dict(headers)
+                if path in etags:
+                    request_headers['If-None-Match'] = etags[path]
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=request_headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        failed += 1
+                    elif revalidate and response.getheader('ETag'):
+                        etags[path] = response.getheader('ETag')
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port)
+                    continue
+                own.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(own)
+                errors.append(failed)
+
+        threads = [
+            threading.Thread(target=client, args=(number,))
+            for number in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(
+                statistics.fmean(latencies) * 1000 if latencies else 0, 2
+            ),
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"сервер":<6} {"воркеры":>8} {"RSS, МБ":>9} {"rps":>9} '
+            f'{"rps/100МБ":>10} {"p50, мс":>9} {"p99, мс":>9} '
+            f'{"ошибки":>7}'
+        )
+        for kind, stats in results.items():
+            self.stdout.write(
+                f'{kind:<6} {stats["workers"]:>8} {stats["rss_mb"]:>9} '
+                f'{stats["rps"]:>9} {stats["rps_per_100mb"]:>10} '
+                f'{stats["p50_ms"]:>9} {stats["p99_ms"]:>9} '
+                f'{stats["errors"]:>7}'
+            )
@@ -0,0 +1,172 @@
+import json
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from users.models import Follow, User
+
+# Таблицы, которые растут вместе с пользователями; справочники (теги,
+# ингредиенты) малы, и полное чтение для них нормально.
+HOT_TABLES = {
+    Recipe._meta.db_table,
+    Recipe.tags.through._meta.db_table,
+    Favorite._meta.db_table,
+    ShoppingCart._meta.db_table,
+    Follow._meta.db_table,
+}
+SCANS = ('Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+
+def endpoints(user):
+    recipe = Recipe.objects.order_by('-pub_date').first()
+    tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+    author = Recipe.objects.values_list('author_id', flat=True).first()
+    anonymous = [
+        '/api/recipes/',
+        '/api/recipes/?page=3',
+        '/api/recipes/?limit=20&cursor=',
+        f'/api/recipes/?author={author}',
+        f'/api/recipes/{recipe.pk}/',
+    ]
+    if tags:
+        query = '&'.join(f'tags={slug}' for slug in tags)
+        anonymous += [
+            f'/api/recipes/?{query}',
+            f'/api/recipes/?{query}&tags_match=all',
+        ]
+    authorized = [
+        '/api/recipes/',
+        '/api/recipes/?is_favorited=1',
+        '/api/recipes/?is_in_shopping_cart=1',
+        '/api/recipes/shopping_list/',
+        '/api/users/subscriptions/?recipes_limit=3',
+    ]
+    return [(path, None) for path in anonymous] + [
+        (path, user) for path in authorized
+    ]
+
+
+def walk(plan, parents=()):
+    yield plan, parents
+    for child in plan.get('Plans', ()):
+        yield from walk(child, parents + (plan,))
+
+
+def problems(plan):
+    """Последовательные чтения и сортировки целой горячей таблицы."""
+    found = []
+    for node, parents in walk(plan):
+        table = node.get('Relation Name')
+        if node['Node Type'] not in SCANS or table not in HOT_TABLES:
+            continue
+        if node['Node Type'] == 'Seq Scan':
+            found.append(f'Seq Scan по {table}')
+        elif not any(key in node for key in ('Index Cond', 'Recheck Cond',
+                                             'Filter')) and any(
+                parent['Node Type'] in ('Sort', 'Incremental Sort')
+                for parent in parents):
+            found.append(f'сортировка всей таблицы {table}')
+    return found
+
+
+def explain(path, user=None, planner_defaults=False):
+    """
+    Выполняет GET path и возвращает (sql, план) для каждого SELECT.
+    Без planner_defaults seq scan запрещён, чтобы и на небольшой базе
+    было видно, есть ли подходящий индекс.
+    """
+    for alias in ('default', 'responses'):
+        caches[alias].clear()
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(path)
+    if response.status_code != 200:
+        raise CommandError(f'{path}: ответ {response.status_code}')
+    for query in captured.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not planner_defaults:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        yield sql, plan[0]['Plan']
+
+
+def index_names(plan):
+    return {
+        node['Index Name'] for node, _ in walk(plan) if 'Index Name' in node
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет запросы горячих эндпоинтов на заполненной базе, '
+        'делает для каждого EXPLAIN и завершается ошибкой, если план '
+        'читает горячую таблицу целиком'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя для авторизованных запросов '
+                 '(по умолчанию — с самой большой корзиной)',
+        )
+        parser.add_argument(
+            '--planner-defaults', action='store_true',
+            help='Не запрещать планировщику seq scan. По умолчанию он '
+                 'запрещён, чтобы на небольшой базе проверить, что '
+                 'подходящий индекс вообще есть',
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех запросов',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'EXPLAIN-проверка работает только на PostgreSQL'
+            )
+        if not Recipe.objects.exists():
+            raise CommandError('База пуста: сначала заполните её данными')
+        user = self.get_user(options['user'])
+        failures = checked = 0
+        for path, as_user in endpoints(user):
+            for sql, plan in explain(
+                    path, as_user, options['planner_defaults']):
+                checked += 1
+                found = problems(plan)
+                if options['verbose_plans'] or found:
+                    self.stdout.write(f'{path}\n  {sql[:300]}')
+                    self.stdout.write(json.dumps(plan, indent=1)[:4000])
+                for problem in found:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f'  ✗ {problem}'))
+        if failures:
+            raise CommandError(
+                f'Проблемных планов: {failures} из {checked} запросов'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов: {checked}, полных чтений нет'
+        ))
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        cart = ShoppingCart.objects.values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        if cart is not None:
+            return User.objects.get(pk=cart['user'])
+        return User.objects.first()
@@ -1,21 +1,127 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from foodgram.settings import BASE_DIR
+from recipes.conditional import bump_model_version
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 
+FORMATS = ('csv', 'json')
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as file:
+        for item in json.load(file):
+            yield item['name'], item['measurement_unit']
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из csv или json без удаления существующих: '
+        'новые добавляются, уже известные пропускаются. Пара (название, '
+        'единица) — ключ unique_ingredient, поэтому существующие строки '
+        'не обновляются: другая единица у известного названия — это новый '
+        'ингредиент'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=str(Path(BASE_DIR) / 'data' / 'ingredients.csv'),
+            help='Путь к файлу (по умолчанию data/ingredients.csv)',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS, dest='file_format',
+            help='Формат файла, по умолчанию — по расширению',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать, что будет добавлено, ничего не записывая',
+        )
+
     def handle(self, *args, **options):
-        Ingredient.objects.all().delete()
-        ingredient = f"{BASE_DIR}/data/ingredients.csv"
-        with open(ingredient) as file:
-            reader = csv.reader(file)
-            counter = 0
-            for row in reader:
-                print(row[0])
-                Ingredient.objects.create(name=row[0], measurement_unit=row[1])
-                counter += 1
-
-        print(f"в базу данных успешно добавлены ингредиенты - {counter} шт. ✅")
+        path = Path(options['path'])
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        reader = read_csv if file_format == 'csv' else read_json
+
+        started = time.perf_counter()
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        known_names = {name for name, _ in existing}
+        seen = set()
+        inserted = skipped = new_units = 0
+
+        def new_rows():
+            nonlocal skipped, new_units
+            for name, unit in reader(path):
+                key = (name.strip(), unit.strip())
+                if not all(key) or key in seen:
+                    continue
+                seen.add(key)
+                if key in existing:
+                    skipped += 1
+                    continue
+                if key[0] in known_names:
+                    new_units += 1
+                yield key
+
+        with transaction.atomic():
+            for batch in batched(new_rows(), options['batch_size']):
+                inserted += len(batch)
+                if options['dry_run']:
+                    for name, unit in batch:
+                        self.stdout.write(f'+ {name}, {unit}')
+                    continue
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in batch),
+                    ignore_conflicts=True,
+                )
+        missing = len(existing - seen)
+        elapsed = time.perf_counter() - started
+        if inserted and not options['dry_run']:
+            ingredient_index.invalidate()
+            bump_model_version(Ingredient)
+
+        total = inserted + skipped
+        prefix = 'будет добавлено' if options['dry_run'] else 'добавлено'
+        self.stdout.write(
+            f'{prefix}: {inserted}, уже есть в базе (пропущено): {skipped}'
+        )
+        if new_units:
+            self.stdout.write(
+                f'из них известные названия с новой единицей: {new_units}'
+            )
+        if missing:
+            self.stdout.write(
+                f'в базе, но не в файле (не удаляются): {missing}'
+            )
+        self.stdout.write(
+            f'обработано {total} строк за {elapsed:.3f} с '
+            f'({total / elapsed if elapsed else 0:.0f} строк/с) ✅'
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики избранного, корзин, '
+        'рецептов и подписчиков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = rebuild_counters(dry_run=options['dry_run'])
+        for counter, rows in drift.items():
+            self.stdout.write(f'{counter}: расхождений - {rows}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes import cache as recipe_cache
+
+
+class Command(BaseCommand):
+    help = 'Статистика кэша карточек рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Сбросить все закэшированные карточки',
+        )
+
+    def handle(self, *args, **options):
+        stats = recipe_cache.get_stats()
+        self.stdout.write(
+            f"попаданий: {stats['hits']}, промахов: {stats['misses']}, "
+            f"доля попаданий: {stats['hit_ratio']:.2%}"
+        )
+        if options['reset']:
+            recipe_cache.reset_stats()
+        if options['flush']:
+            recipe_cache.bump_generation()
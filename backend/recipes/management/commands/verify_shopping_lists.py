@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённые списки покупок с пересчитанными с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Проверить только указанных пользователей (id)',
+        )
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересобрать списки пользователей с расхождениями',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = shopping_list.verify(
+            user_ids=options['users'], fix=options['fix']
+        )
+        for user_id, ingredient_id, expected, actual in mismatches:
+            self.stdout.write(
+                f'пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидалось {expected}, сохранено {actual}'
+            )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        message = f'Расхождений: {len(mismatches)}'
+        if options['fix']:
+            message += ', списки пересобраны'
+        self.stdout.write(self.style.WARNING(message))
@@ -0,0 +1,59 @@
+# Generated by Django 4.0.4 on 2026-10-18 18:54
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update();
+
+UPDATE recipes_recipe SET search_vector =
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(text, '')), 'B');
+
+CREATE INDEX recipes_recipe_search_vector_gin
+ON recipes_recipe USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();
+"""
+
+
+def create_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredientrecipe_recipe_shoppingcart_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.0.4 on 2026-10-18 18:55
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель со счётчиком, поле счётчика, модель связи, поле связи) — копия
+# recipes.counters.COUNTERS на момент миграции, чтобы её результат
+# не зависел от последующих правок модуля.
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'carts_count', 'recipes.ShoppingCart', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'author'),
+)
+
+
+def backfill_counters(apps, schema_editor):
+    for model_name, field, related_name, related_field in COUNTERS:
+        related_model = apps.get_model(related_name)
+        actual = Coalesce(
+            Subquery(
+                related_model.objects.filter(
+                    **{related_field: OuterRef('pk')}
+                )
+                .order_by()
+                .values(related_field)
+                .annotate(total=Count('pk'))
+                .values('total'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+        apps.get_model(model_name).objects.update(**{field: actual})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_search_vector'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в корзину'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.0.4 on 2026-10-18 18:57
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    totals = IngredientRecipe.objects.filter(
+        recipe__carts__isnull=False
+    ).values('recipe__carts__user_id', 'ingredient_id').annotate(
+        total=Sum('amount')
+    ).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['recipe__carts__user_id'],
+                ingredient_id=row['ingredient_id'],
+                total_amount=row['total'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(default=0, verbose_name='Общее количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Список покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='uniq_shopping_list_user_ingredient'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
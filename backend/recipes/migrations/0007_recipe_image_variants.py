@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+    ]
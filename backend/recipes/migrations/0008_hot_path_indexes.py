@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'id'], name='recipe_pub_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='cart_recipe_user_idx'),
+        ),
+    ]
@@ -1,6 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from users.models import Follow
 
 User = get_user_model()
 
@@ -35,9 +41,60 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags', 'ingredient_to_recipe__ingredient'
+        ).defer('search_vector')
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def latest_per_author(self, author_ids, limit=None):
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return queryset
+        if not author_ids:
+            return queryset.none()
+        ranked = queryset.order_by().annotate(
+            position=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        ).values('id', 'position')
+        sql, params = ranked.query.sql_with_params()
+        # Условие на авторов повторяется снаружи: иначе на небольших
+        # таблицах планировщик соединяет ranked с полным чтением рецептов.
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.position <= %s',
+            (*params, limit),
+        ))
+
+
 class Recipe(models.Model):
     name = models.CharField('Название рецепта', max_length=200)
     image = models.ImageField('Изображение', upload_to='media/recipes/images/')
+    image_variants = models.JSONField(
+        'Варианты изображения', default=dict, blank=True, editable=False
+    )
     text = models.TextField('Описание')
     author = models.ForeignKey(
         User,
@@ -68,11 +125,31 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False
+    )
+    carts_count = models.PositiveIntegerField(
+        'Добавлений в корзину', default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            # Лента и курсорная пагинация: ORDER BY pub_date DESC, id.
+            models.Index(
+                fields=('-pub_date', 'id'), name='recipe_pub_date_id_idx'
+            ),
+            # Рецепты автора и превью в подписках.
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.name} ({self.author})'
@@ -132,6 +209,11 @@ class Favorite(models.Model):
                 name='uniq_favorite_user_recipe',
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'), name='favorite_recipe_user_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} -> {self.recipe}'
@@ -158,3 +240,34 @@ class ShoppingCart(models.Model):
             models.UniqueConstraint(fields=('user', 'recipe'),
                                     name='uniq_cart_user_recipe')
         ]
+        indexes = [
+            models.Index(fields=('recipe', 'user'),
+                         name='cart_recipe_user_idx')
+        ]
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField('Общее количество', default=0)
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'ingredient'),
+                                    name='uniq_shopping_list_user_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total_amount}'
@@ -1,5 +1,201 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
-    page_size_query_param = 'limit'
\ No newline at end of file
+    page_size_query_param = 'limit'
+
+
+def approximate_count(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по ключу (field, id) без OFFSET и COUNT(*).
+    Курсор содержит значения ключа последней (или первой) записи страницы.
+    """
+    ordering = ('-pub_date', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор'
+    # Параметры, задающие свой порядок выдачи: курсор хранит только ключ
+    # ordering, поэтому вместе с ними листать по нему нельзя.
+    ordering_query_params = ('search', 'ordering')
+    ordering_conflict_message = 'Курсор нельзя сочетать с параметрами: {}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        conflicts = [
+            param for param in self.ordering_query_params
+            if param in request.query_params
+        ]
+        if conflicts:
+            raise ParseError(
+                self.ordering_conflict_message.format(', '.join(conflicts))
+            )
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        field, id_field = self.ordering
+        self.field = field.lstrip('-')
+        self.descending = field.startswith('-')
+        self.id_field = id_field
+        self.model_field = queryset.model._meta.get_field(self.field)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = approximate_count(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(
+                self.position_filter(position, reverse)
+            )
+        queryset = queryset.order_by(*self.get_ordering(reverse))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (
+            position is not None if not reverse else has_more
+        )
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        id_prefix = '-' if reverse else ''
+        return (f'{prefix}{self.field}', f'{id_prefix}{self.id_field}')
+
+    def position_filter(self, position, reverse):
+        value, pk = position
+        descending = self.descending != reverse
+        lookup = 'lt' if descending else 'gt'
+        id_lookup = 'lt' if reverse else 'gt'
+        return (
+            Q(**{f'{self.field}__{lookup}': value})
+            | Q(**{self.field: value, f'{self.id_field}__{id_lookup}': pk})
+        )
+
+    def encode_cursor(self, instance, reverse):
+        value = self.model_field.value_to_string(instance)
+        pk = getattr(instance, self.id_field)
+        token = json.dumps([value, pk, reverse], separators=(',', ':'))
+        return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padding = '=' * (-len(token) % 4)
+            value, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(token + padding)
+            )
+            value = self.model_field.to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), bool(reverse)
+
+    def get_link(self, instance, reverse):
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            self.encode_cursor(instance, reverse)
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ('username', 'id')
+    ordering_query_params = ('ordering',)
+
+
+class FeedPagination(BasePagination):
+    """
+    Номера страниц (page/limit) по умолчанию, курсор — если в запросе
+    передан параметр cursor (для первой страницы — пустой).
+    """
+    page_pagination_class = CustomPageNumberPagination
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_pagination_class.cursor_query_param in (
+                request.query_params):
+            self.paginator = self.cursor_pagination_class()
+        else:
+            self.paginator = self.page_pagination_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class SubscriptionFeedPagination(FeedPagination):
+    cursor_pagination_class = SubscriptionKeysetPagination
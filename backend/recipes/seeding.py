@@ -0,0 +1,433 @@
+"""
+Синтетические данные для бенчмарков и локальной проверки под нагрузкой.
+
+Первичные ключи назначаются заранее (после текущего максимума), поэтому
+связи генерируются без обращений к базе, а строки пишутся пачками:
+через COPY в PostgreSQL и executemany в остальных базах. Сигналы при этом
+не срабатывают: счётчики считаются при генерации, списки покупок
+собираются в конце, а версии в кэшах сбрасываются после коммита.
+
+Популярность авторов, число ингредиентов в рецепте и подписок
+у пользователя можно задать степенным законом: при alpha > 0 i-й по
+популярности автор выбирается с весом (i + 1) ** -alpha, а число k
+от 1 до максимума — с весом k ** -alpha. При alpha = 0 авторы
+равновероятны, а число всегда равно максимуму.
+"""
+import csv
+import io
+import json
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from users.models import Follow, User
+from . import cache as recipe_cache
+from . import shopping_list
+from .conditional import bump_model_version
+from .ingredient_index import ingredient_index
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Tag)
+from .tag_index import tag_index
+
+PASSWORD = 'benchmark-password'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2D9CDB')
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'омлет',
+    'паста', 'плов', 'блины', 'котлеты', 'соус', 'десерт', 'гарнир',
+)
+# Даты не зависят от времени запуска: одинаковый seed даёт одинаковую базу.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+PLACEHOLDER_IMAGES = 16
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r',
+})
+
+
+@dataclass(frozen=True)
+class Dataset:
+    users: int
+    recipes: int
+    ingredients_per_recipe: int
+    favorites_per_user: int
+    carts_per_user: int
+    follows_per_user: int
+    tags: int = 10
+    author_alpha: float = 0.0
+    ingredients_alpha: float = 0.0
+    follows_alpha: float = 0.0
+    images: bool = False
+
+
+DATASETS = {
+    'small': Dataset(50, 500, 6, 20, 5, 10),
+    'medium': Dataset(500, 5_000, 8, 50, 8, 25),
+    'large': Dataset(2_000, 50_000, 10, 100, 10, 50),
+    'huge': Dataset(
+        100_000, 1_000_000, 15, 20, 5, 200,
+        author_alpha=1.1, ingredients_alpha=1.2, follows_alpha=1.5,
+    ),
+}
+
+
+def load_ingredients(path=None):
+    if Ingredient.objects.exists():
+        return list(Ingredient.objects.values_list('pk', flat=True))
+    path = path or Path(settings.BASE_DIR) / 'data' / 'ingredients.csv'
+    with open(path, encoding='utf-8', newline='') as file:
+        rows = {(row[0], row[1]) for row in csv.reader(file) if len(row) >= 2}
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=unit)
+         for name, unit in sorted(rows)),
+        batch_size=1000,
+    )
+    return list(Ingredient.objects.values_list('pk', flat=True))
+
+
+def load_tags(count):
+    Tag.objects.bulk_create(
+        (
+            Tag(name=f'тег {number}', slug=f'tag-{number}',
+                color=TAG_COLORS[number % len(TAG_COLORS)])
+            for number in range(count)
+        ),
+        ignore_conflicts=True,
+    )
+    return list(Tag.objects.filter(
+        slug__in=[f'tag-{number}' for number in range(count)]
+    ).values_list('pk', flat=True))
+
+
+def placeholder_images(rng, count=PLACEHOLDER_IMAGES):
+    """Небольшие однотонные JPEG, на которые ссылаются рецепты по кругу."""
+    upload_to = Recipe._meta.get_field('image').upload_to
+    names = []
+    for number in range(count):
+        buffer = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (640, 480), color).save(buffer, 'JPEG', quality=80)
+        names.append(default_storage.save(
+            f'{upload_to}placeholder_{number}.jpg',
+            ContentFile(buffer.getvalue()),
+        ))
+    return names
+
+
+def popularity(rng, ids, alpha):
+    """
+    ids в случайном порядке и накопленные веса Zipf для random.choices;
+    при alpha = 0 весов нет и выбор равновероятный.
+    """
+    ranked = list(ids)
+    rng.shuffle(ranked)
+    if not alpha:
+        return ranked, None
+    return ranked, list(accumulate(
+        (rank + 1) ** -alpha for rank in range(len(ranked))
+    ))
+
+
+def count_sampler(rng, maximum, alpha):
+    """Функция, возвращающая число от 1 до maximum с весом k ** -alpha."""
+    if not alpha or maximum <= 1:
+        return lambda: maximum
+    values = range(1, maximum + 1)
+    cum_weights = list(accumulate(k ** -alpha for k in values))
+    return lambda: rng.choices(values, cum_weights=cum_weights)[0]
+
+
+def weighted_sample(rng, population, cum_weights, k, exclude=None):
+    """
+    До k различных элементов population. С весами повторы неизбежны,
+    поэтому выборка добирается несколько раундов: при сильном перекосе
+    популярности пользователь может получить меньше k подписок.
+    """
+    k = min(k, len(population) - (exclude is not None))
+    if cum_weights is None:
+        chosen = rng.sample(population, min(k + 1, len(population)))
+        return [item for item in chosen if item != exclude][:k]
+    chosen = set()
+    for _ in range(10):
+        missing = k - len(chosen)
+        if missing <= 0:
+            break
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=missing
+        ))
+        chosen.discard(exclude)
+    return list(chosen)
+
+
+def copy_text(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return value.translate(COPY_ESCAPES)
+
+
+class RowWriter:
+    """
+    Копит строки модели (словари attname → значение) и пишет их пачками:
+    COPY или executemany. Это не bulk_create, поэтому pre_save не
+    вызывается и auto_now_add не подменяет переданные даты. Не переданные
+    поля получают значение по умолчанию, автоинкрементный ключ без
+    значения заполняет база.
+    """
+
+    def __init__(self, model, batch_size, use_copy):
+        self.model = model
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.fields = {
+            field.attname: field for field in model._meta.concrete_fields
+        }
+        self.defaults = {
+            attname: field.get_default()
+            for attname, field in self.fields.items()
+        }
+        self.rows = []
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, **values):
+        self.rows.append(values)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        pk = self.model._meta.pk.attname
+        columns = [
+            attname for attname in self.fields
+            if attname != pk or pk in self.rows[0]
+        ]
+        if self.use_copy:
+            self.copy(columns)
+        else:
+            self.insert(columns)
+        self.written += len(self.rows)
+        self.rows = []
+
+    def copy(self, columns):
+        buffer = io.StringIO()
+        for values in self.rows:
+            buffer.write('\t'.join(
+                copy_text(values.get(column, self.defaults[column]))
+                for column in columns
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {self.table(columns)} FROM STDIN', buffer
+            )
+
+    def insert(self, columns):
+        fields = [self.fields[column] for column in columns]
+        params = [
+            [
+                field.get_db_prep_save(
+                    values.get(column, self.defaults[column]), connection
+                )
+                for column, field in zip(columns, fields)
+            ]
+            for values in self.rows
+        ]
+        placeholders = ', '.join(['%s'] * len(columns))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table(columns)} '
+                f'VALUES ({placeholders})',
+                params,
+            )
+
+    def table(self, columns):
+        quote = connection.ops.quote_name
+        return (
+            f'{quote(self.model._meta.db_table)} '
+            f'({", ".join(quote(column) for column in columns)})'
+        )
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def reset_sequences(*models):
+    """После вставки с явными id сдвигает последовательности PostgreSQL."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+@transaction.atomic
+def seed(dataset, random_seed=0, batch_size=2000, use_copy=None,
+         log=None):
+    """
+    Добавляет к базе набор данных dataset и возвращает число созданных
+    строк по таблицам. Существующие данные не трогаются: новые
+    пользователи и рецепты получают id после текущих, а избранное,
+    корзины и подписки связывают только новые строки.
+
+    Связи пишутся раньше рецептов и пользователей (внешние ключи
+    проверяются при коммите), чтобы счётчики считались по ходу
+    генерации, а не отдельным UPDATE по всем таблицам.
+    """
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    log = log or (lambda message: None)
+    rng = random.Random(random_seed)
+    ingredient_ids = load_ingredients()
+    tag_ids = load_tags(dataset.tags)
+    images = placeholder_images(rng) if dataset.images else ['']
+
+    def writer(model):
+        return RowWriter(model, batch_size, use_copy)
+
+    first_user, first_recipe = next_id(User), next_id(Recipe)
+    user_ids = range(first_user, first_user + dataset.users)
+    recipe_ids = range(first_recipe, first_recipe + dataset.recipes)
+    recipes_count = [0] * len(user_ids)
+    followers_count = [0] * len(user_ids)
+    favorites_count = [0] * len(recipe_ids)
+    carts_count = [0] * len(recipe_ids)
+    authors, author_weights = popularity(
+        rng, user_ids, dataset.author_alpha
+    )
+    written = {}
+
+    follows_count = count_sampler(
+        rng, dataset.follows_per_user, dataset.follows_alpha
+    )
+    with writer(Favorite) as favorites, writer(ShoppingCart) as carts, \
+            writer(Follow) as follows:
+        for user_id in user_ids:
+            for recipe_id in rng.sample(
+                    recipe_ids,
+                    min(dataset.favorites_per_user, len(recipe_ids))):
+                favorites.add(user_id=user_id, recipe_id=recipe_id)
+                favorites_count[recipe_id - first_recipe] += 1
+            for recipe_id in rng.sample(
+                    recipe_ids, min(dataset.carts_per_user, len(recipe_ids))):
+                carts.add(user_id=user_id, recipe_id=recipe_id)
+                carts_count[recipe_id - first_recipe] += 1
+            # Подписываются на авторов с той же популярностью, с какой
+            # они пишут рецепты.
+            for author_id in weighted_sample(
+                    rng, authors, author_weights, follows_count(),
+                    exclude=user_id):
+                follows.add(user_id=user_id, author_id=author_id)
+                followers_count[author_id - first_user] += 1
+    written['favorites'] = favorites.written
+    written['carts'] = carts.written
+    written['follows'] = follows.written
+    log(
+        'избранное, корзины и подписки: '
+        f'{favorites.written + carts.written + follows.written}'
+    )
+
+    ingredients_count = count_sampler(
+        rng, min(dataset.ingredients_per_recipe, len(ingredient_ids)),
+        dataset.ingredients_alpha,
+    )
+    with writer(Recipe) as recipes, \
+            writer(Recipe.tags.through) as recipe_tags, \
+            writer(IngredientRecipe) as recipe_ingredients:
+        for start in range(0, len(recipe_ids), batch_size):
+            chunk = recipe_ids[start:start + batch_size]
+            chunk_authors = rng.choices(
+                authors, cum_weights=author_weights, k=len(chunk)
+            )
+            for recipe_id, author_id in zip(chunk, chunk_authors):
+                recipes_count[author_id - first_user] += 1
+                recipes.add(
+                    id=recipe_id,
+                    name=f'{rng.choice(WORDS)} {recipe_id}',
+                    text=' '.join(rng.choices(WORDS, k=20)),
+                    author_id=author_id,
+                    cooking_time=rng.randint(5, 180),
+                    image=images[recipe_id % len(images)],
+                    pub_date=EPOCH + timedelta(minutes=recipe_id),
+                    favorites_count=favorites_count[recipe_id - first_recipe],
+                    carts_count=carts_count[recipe_id - first_recipe],
+                )
+                for tag_id in rng.sample(
+                        tag_ids, min(rng.randint(1, 3), len(tag_ids))):
+                    recipe_tags.add(recipe_id=recipe_id, tag_id=tag_id)
+                for ingredient_id in rng.sample(
+                        ingredient_ids, ingredients_count()):
+                    recipe_ingredients.add(
+                        recipe_id=recipe_id, ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500),
+                    )
+            log(f'рецепты: {start + len(chunk)} из {len(recipe_ids)}')
+    written['recipes'] = recipes.written
+    written['recipe_tags'] = recipe_tags.written
+    written['recipe_ingredients'] = recipe_ingredients.written
+
+    password = make_password(PASSWORD)
+    with writer(User) as users:
+        for user_id in user_ids:
+            users.add(
+                id=user_id,
+                email=f'user{user_id}@example.com',
+                username=f'user{user_id}',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+                date_joined=EPOCH,
+                recipes_count=recipes_count[user_id - first_user],
+                followers_count=followers_count[user_id - first_user],
+            )
+    written['users'] = users.written
+    log(f'пользователи: {users.written}')
+
+    reset_sequences(User, Recipe)
+    if user_ids:
+        shopping_list.rebuild(user_ids.start, user_ids.stop - 1)
+    log('списки покупок собраны')
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    transaction.on_commit(invalidate_caches)
+    return written
+
+
+def invalidate_caches():
+    """
+    Сбрасывает то, что при обычной записи сбрасывают сигналы: карточки
+    рецептов, версии моделей для ETag и готовых ответов и индексы
+    ингредиентов и тегов.
+    """
+    recipe_cache.bump_generation()
+    bump_model_version(
+        Tag, Ingredient, Recipe, IngredientRecipe, Favorite, ShoppingCart,
+        Follow, User,
+    )
+    ingredient_index.invalidate()
+    tag_index.invalidate()
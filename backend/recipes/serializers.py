@@ -1,16 +1,22 @@
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db import models, transaction
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from drf_base64.fields import Base64ImageField
 
 from users.models import Follow
-from .models import Tag, Ingredient, Recipe, IngredientRecipe, ShoppingCart
+from . import cache as recipe_cache
+from . import images, shopping_list
+from .conditional import bump_model_version_on_commit
+from .models import (Tag, Ingredient, Recipe, IngredientRecipe, ShoppingCart,
+                     ShoppingListItem)
 
 User = get_user_model()
 
 
+RECIPE_BATCH_LIMIT = 100
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('id', 'name', 'color', 'slug')
@@ -29,6 +35,8 @@ class AuthorSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         if request.user.is_anonymous:
             return False
@@ -39,12 +47,12 @@ class AuthorSerializer(serializers.ModelSerializer):
         model = User
         fields = (
             'id', 'email', 'username', 'first_name', 'last_name',
-            'is_subscribed'
+            'is_subscribed', 'recipes_count', 'followers_count'
         )
 
 
 class IngredientCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
 
     class Meta:
         model = IngredientRecipe
@@ -71,24 +79,111 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         ]
 
 
-class RecipeListSerializer(serializers.ModelSerializer):    
+class CachedRecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.Manager) else data
+        )
+        self.child.load_payloads([recipe.pk for recipe in recipes])
+        try:
+            return [self.child.to_representation(item) for item in recipes]
+        finally:
+            self.child.store_payloads()
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id', read_only=True)
+    name = serializers.CharField(source='ingredient.name', read_only=True)
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit', read_only=True
+    )
+    amount = serializers.IntegerField(source='total_amount', read_only=True)
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ("id", "name", "measurement_unit", "amount")
+
+
+class RecipeListSerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+
+    _payloads = None
+
+    def _base_url(self):
+        request = self.context.get("request")
+        return request.build_absolute_uri("/") if request else ""
+
+    def load_payloads(self, recipe_ids):
+        self._payloads, self._payload_keys = recipe_cache.get_payloads(
+            recipe_ids, self._base_url()
+        )
+        self._new_payloads = {}
+
+    def store_payloads(self):
+        recipe_cache.set_payloads(self._new_payloads, self._payload_keys)
+        self._payloads = None
+
+    def to_representation(self, instance):
+        if instance.author is not None and hasattr(
+                instance, "author_is_subscribed"):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        single = self._payloads is None
+        if single:
+            self.load_payloads([instance.pk])
+        payload = self._payloads.get(instance.pk)
+        if payload is None:
+            data = super().to_representation(instance)
+            self._new_payloads[instance.pk] = (
+                recipe_cache.strip_user_fields(data)
+            )
+        else:
+            data = self.overlay_volatile_fields(payload, instance)
+        if single:
+            self.store_payloads()
+        return data
+
+    def overlay_volatile_fields(self, payload, instance):
+        data = dict(payload)
+        data["is_favorited"] = self.get_is_favorited(instance)
+        data["is_in_shopping_cart"] = self.get_is_in_shopping_cart(instance)
+        data["favorites_count"] = instance.favorites_count
+        data["carts_count"] = instance.carts_count
+        author = instance.author
+        if author is not None:
+            data["author"] = dict(
+                payload["author"],
+                is_subscribed=self.fields["author"].get_is_subscribed(author),
+                recipes_count=author.recipes_count,
+                followers_count=author.followers_count,
+            )
+        return data
 
     def get_ingredients(self, obj):
-        queryset = IngredientRecipe.objects.filter(recipe=obj)
+        queryset = obj.ingredient_to_recipe.all()
+        if "ingredient_to_recipe" not in getattr(
+                obj, "_prefetched_objects_cache", {}):
+            queryset = queryset.select_related("ingredient")
         return IngredientRecipeSerializer(queryset, many=True).data
 
+    def get_image_srcset(self, obj):
+        return images.get_srcset(obj, self.context.get("request"))
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return Recipe.objects.filter(favorites_recipe__user=user, id=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
@@ -108,17 +203,18 @@ class RecipeListSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_srcset",
             "text",
             "cooking_time",
+            "favorites_count",
+            "carts_count",
         )
+        list_serializer_class = CachedRecipeListSerializer
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
     ingredients = IngredientCreateSerializer(many=True)
 
@@ -132,59 +228,99 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def create(self, validated_data):
-        ingredients = (
-                validated_data.pop("ingredients")
-                if "ingredients" in validated_data
-                else {}
-        )
-        tags = (
-                validated_data.pop("tags")
-                if "tags" in validated_data
-                else {}
-        )
+        ingredients = validated_data.pop("ingredients", [])
+        tags = validated_data.pop("tags", [])
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        for ingredient in ingredients:
-            IngredientRecipe.objects.get_or_create(
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
                 recipe=recipe,
-                ingredient=ingredient["id"],
+                ingredient_id=ingredient["id"],
                 amount=ingredient["amount"]
             )
+            for ingredient in ingredients
+        )
+        images.schedule_recipe_image(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = (
-                validated_data.pop("ingredients")
-                if "ingredients" in validated_data
-                else {}
-        )
-        tags = (
-                validated_data.pop("tags")
-                if "tags" in validated_data
-                else {}
-        )
-        for field, value in validated_data.items():
-            setattr(instance, field, value)
-        instance.tags.set(tags)
-        instance.image = validated_data.get('image', instance.image)
-        instance.ingredients.clear()
-        for ingredient in ingredients:
-            IngredientRecipe.objects.get_or_create(
-                recipe=instance, ingredient=ingredient["id"],
-                amount=ingredient["amount"]
+        ingredients = validated_data.pop("ingredients", None)
+        tags = validated_data.pop("tags", None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None and self.update_ingredients(
+                instance, ingredients):
+            recipe_cache.bump_recipes_on_commit([instance.pk])
+            bump_model_version_on_commit(IngredientRecipe)
+        if "image" in validated_data:
+            validated_data["image_variants"] = {}
+        if validated_data:
+            for field, value in validated_data.items():
+                setattr(instance, field, value)
+            instance.save(update_fields=list(validated_data))
+        if "image" in validated_data:
+            images.schedule_recipe_image(instance)
+        return instance
+
+    @staticmethod
+    def update_ingredients(instance, ingredients):
+        existing = {
+            item.ingredient_id: item
+            for item in instance.ingredient_to_recipe.all()
+        }
+        submitted = {
+            ingredient["id"]: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        to_delete = [
+            item.pk for ingredient_id, item in existing.items()
+            if ingredient_id not in submitted
+        ]
+        to_create = [
+            IngredientRecipe(
+                recipe=instance, ingredient_id=ingredient_id, amount=amount
             )
-        return super().update(instance, validated_data)
-
-    def validate(self, data):
-        ingredient_data = self.initial_data.get("ingredients")
-        ingredient_in_recipe = set()
-        for ingredient in ingredient_data:
-            ingredient_obj = get_object_or_404(Ingredient, id=ingredient["id"])
-            if ingredient_obj in ingredient_in_recipe:
-                raise serializers.ValidationError("Дубликат ингредиента")
-            ingredient_in_recipe.add(ingredient_obj)
-        return data
+            for ingredient_id, amount in submitted.items()
+            if ingredient_id not in existing
+        ]
+        to_update = []
+        deltas = {item.ingredient_id: item.amount for item in to_create}
+        for ingredient_id, item in existing.items():
+            amount = submitted.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                to_update.append(item)
+        if to_delete:
+            IngredientRecipe.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            IngredientRecipe.objects.bulk_create(to_create)
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ("amount",))
+        shopping_list.apply_ingredient_deltas(instance.pk, deltas)
+        return bool(to_delete or to_create or to_update)
+
+    def validate_tags(self, value):
+        tags = Tag.objects.in_bulk(value)
+        missing = [pk for pk in value if pk not in tags]
+        if missing:
+            raise serializers.ValidationError(
+                f"Тегов не существует: {missing}"
+            )
+        return value
+
+    def validate_ingredients(self, value):
+        ids = [ingredient["id"] for ingredient in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Дубликат ингредиента")
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f"Ингредиентов не существует: {missing}"
+            )
+        return value
 
     class Meta:
         model = Recipe
@@ -201,11 +337,25 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class FollowRecipeSerializer(serializers.ModelSerializer):
+    image_srcset = serializers.SerializerMethodField()
+
+    def get_image_srcset(self, obj):
+        return images.get_srcset(obj, self.context.get("request"))
+
     class Meta:
         model = Recipe
         fields = (
             "id",
             "name",
             "image",
+            "image_srcset",
             "cooking_time",
-        )
\ No newline at end of file
+        )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_LIMIT,
+    )
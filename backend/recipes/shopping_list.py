@@ -0,0 +1,320 @@
+import csv
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from . import cache as recipe_cache
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+EMPTY_MESSAGE = 'Список покупок пуст'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+CHUNK_SIZE = 500
+PDF_FONT = 'ShoppingListFont'
+# Выгрузки моложе этого возраста не удаляются как устаревшие: их может
+# прямо сейчас отдавать nginx по ответу на параллельный запрос.
+STALE_EXPORT_AGE = 60
+
+
+def get_items(user):
+    return ShoppingListItem.objects.filter(
+        user=user, total_amount__gt=0
+    ).select_related('ingredient').order_by('ingredient__name')
+
+
+def get_rows(user):
+    return get_items(user).values_list(
+        'ingredient__name', 'total_amount', 'ingredient__measurement_unit'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+UPSERT_SQL = """
+INSERT INTO {items} (user_id, ingredient_id, total_amount)
+{select}
+ON CONFLICT (user_id, ingredient_id) DO UPDATE
+SET total_amount = {items}.total_amount + EXCLUDED.total_amount
+"""
+
+
+def _upsert(select, params):
+    sql = UPSERT_SQL.format(
+        items=connection.ops.quote_name(ShoppingListItem._meta.db_table),
+        select=select,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _delete_empty(user_ids=None, ingredient_ids=None):
+    items = ShoppingListItem.objects.filter(total_amount__lte=0)
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    if ingredient_ids is not None:
+        items = items.filter(ingredient_id__in=ingredient_ids)
+    items.delete()
+
+
+def add_recipes(user_id, recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    _upsert(
+        'SELECT %s, ingredient_id, SUM(amount) FROM {} '
+        'WHERE recipe_id IN ({}) GROUP BY ingredient_id'.format(
+            connection.ops.quote_name(IngredientRecipe._meta.db_table),
+            placeholders,
+        ),
+        [user_id, *recipe_ids],
+    )
+
+
+def add_recipe(user_id, recipe_id):
+    add_recipes(user_id, [recipe_id])
+
+
+def remove_recipes(user_id, recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    ingredients = IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+    amounts = ingredients.filter(
+        ingredient_id=OuterRef('ingredient_id')
+    ).order_by().values('ingredient_id').annotate(
+        total=Sum('amount')
+    ).values('total')
+    ShoppingListItem.objects.filter(
+        user_id=user_id,
+        ingredient_id__in=ingredients.values('ingredient_id'),
+    ).update(total_amount=F('total_amount') - Subquery(amounts))
+    _delete_empty(user_ids=[user_id])
+
+
+def remove_recipe(user_id, recipe_id):
+    remove_recipes(user_id, [recipe_id])
+
+
+def apply_ingredient_deltas(recipe_id, deltas):
+    """
+    Переносит изменение состава рецепта ({ingredient_id: delta})
+    в списки покупок всех, у кого рецепт лежит в корзине.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    values = ', '.join(['(%s, %s)'] * len(deltas))
+    params = [value for item in deltas.items() for value in item]
+    _upsert(
+        'SELECT cart.user_id, deltas.column1, deltas.column2 '
+        f'FROM {connection.ops.quote_name(ShoppingCart._meta.db_table)} '
+        f'AS cart CROSS JOIN (VALUES {values}) AS deltas '
+        'WHERE cart.recipe_id = %s',
+        params + [recipe_id],
+    )
+    _delete_empty(ingredient_ids=list(deltas))
+
+
+def expected_totals(user_ids=None):
+    rows = IngredientRecipe.objects.filter(recipe__carts__isnull=False)
+    if user_ids is not None:
+        rows = rows.filter(recipe__carts__user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.values(
+            'recipe__carts__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).values_list(
+            'recipe__carts__user_id', 'ingredient_id', 'total'
+        ).order_by().iterator(chunk_size=CHUNK_SIZE)
+    }
+
+
+def verify(user_ids=None, fix=False):
+    expected = expected_totals(user_ids)
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    actual = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in items.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        ).iterator(chunk_size=CHUNK_SIZE)
+        if total > 0
+    }
+    mismatches = sorted(
+        (key[0], key[1], expected.get(key), actual.get(key))
+        for key in expected.keys() | actual.keys()
+        if expected.get(key) != actual.get(key)
+    )
+    if fix and mismatches:
+        broken_users = {user_id for user_id, *_ in mismatches}
+        with transaction.atomic():
+            ShoppingListItem.objects.filter(
+                user_id__in=broken_users
+            ).delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total,
+                    )
+                    for (user_id, ingredient_id), total in expected.items()
+                    if user_id in broken_users
+                ),
+                batch_size=CHUNK_SIZE,
+            )
+    return mismatches
+
+
+def rebuild(first_user_id, last_user_id):
+    """
+    Собирает списки покупок пользователей с id из диапазона одним
+    INSERT ... SELECT: быстрее verify(fix=True) для миллионов корзин,
+    которые добавлены в обход сигналов.
+    """
+    quote = connection.ops.quote_name
+    ShoppingListItem.objects.filter(
+        user__id__range=(first_user_id, last_user_id)
+    ).delete()
+    _upsert(
+        'SELECT cart.user_id, ingredients.ingredient_id, '
+        'SUM(ingredients.amount) '
+        f'FROM {quote(ShoppingCart._meta.db_table)} AS cart '
+        f'JOIN {quote(IngredientRecipe._meta.db_table)} AS ingredients '
+        'ON ingredients.recipe_id = cart.recipe_id '
+        'WHERE cart.user_id BETWEEN %s AND %s '
+        'GROUP BY cart.user_id, ingredients.ingredient_id',
+        [first_user_id, last_user_id],
+    )
+
+
+def render_txt(rows):
+    empty = True
+    for index, (name, amount, unit) in enumerate(rows, start=1):
+        empty = False
+        yield f'{index}. {name} - {amount} {unit}\n'
+    if empty:
+        yield f'{EMPTY_MESSAGE}\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def register_pdf_font():
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_LIST_PDF_FONT)
+        )
+
+
+def render_pdf(rows):
+    register_pdf_font()
+    # reportlab пишет документ целиком в save(), поэтому PDF собирается
+    # в памяти и только отдаётся частями; txt и csv идут прямо из курсора.
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 20
+    page.setFont(PDF_FONT, 16)
+    page.drawString(margin, height - margin, 'Список покупок')
+    y = height - margin - 2 * line_height
+    page.setFont(PDF_FONT, 12)
+    empty = True
+    for index, (name, amount, unit) in enumerate(rows, start=1):
+        empty = False
+        if y < margin:
+            page.showPage()
+            page.setFont(PDF_FONT, 12)
+            y = height - margin
+        page.drawString(margin, y, f'{index}. {name} - {amount} {unit}')
+        y -= line_height
+    if empty:
+        page.drawString(margin, y, EMPTY_MESSAGE)
+    page.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(64 * 1024), b'')
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
+
+
+def get_etag(user, file_format):
+    recipe_ids = sorted(
+        ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )
+    )
+    generation, versions = recipe_cache.get_versions(recipe_ids)
+    signature = f'{file_format}:{generation}:' + ','.join(
+        f'{recipe_id}.{versions[recipe_id]}' for recipe_id in recipe_ids
+    )
+    return '"{}"'.format(hashlib.sha1(signature.encode()).hexdigest())
+
+
+def export_file(user, file_format, etag):
+    """
+    Записывает список покупок в закрытый каталог и возвращает путь
+    относительно PROTECTED_MEDIA_ROOT. Имя файла — ETag, поэтому
+    неизменившийся список не пересобирается. Файл пишется во временный
+    с уникальным именем и переименовывается, так что параллельные
+    выгрузки не видят чужих недописанных файлов.
+    """
+    folder = os.path.join('shopping_lists', str(user.pk))
+    filename = f'{etag.strip(chr(34))}.{file_format}'
+    name = os.path.join(folder, filename)
+    directory = os.path.join(settings.PROTECTED_MEDIA_ROOT, folder)
+    path = os.path.join(directory, filename)
+    if os.path.exists(path):
+        return name
+    os.makedirs(directory, exist_ok=True)
+    render, _ = FORMATS[file_format]
+    with tempfile.NamedTemporaryFile(
+            dir=directory, suffix='.tmp', delete=False) as file:
+        try:
+            for chunk in render(get_rows(user)):
+                file.write(
+                    chunk.encode() if isinstance(chunk, str) else chunk
+                )
+        except BaseException:
+            os.remove(file.name)
+            raise
+    # NamedTemporaryFile создаёт файл с правами 0600, а читает его nginx.
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+    remove_stale_exports(directory, filename, file_format)
+    return name
+
+
+def remove_stale_exports(directory, keep, file_format):
+    expires = time.time() - STALE_EXPORT_AGE
+    for entry in os.scandir(directory):
+        if entry.name == keep or not entry.name.endswith(
+                (f'.{file_format}', '.tmp')):
+            continue
+        try:
+            if entry.stat().st_mtime < expires:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,171 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import cache as recipe_cache
+from . import shopping_list
+from .conditional import bump_model_version_on_commit
+from .counters import increment
+from .ingredient_index import ingredient_index
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Tag)
+from .tag_index import tag_index
+from users.models import Follow
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    recipe_cache.bump_recipes_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    recipe_cache.bump_recipes_on_commit([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_cache.bump_recipes_on_commit([instance.pk])
+    elif pk_set:
+        recipe_cache.bump_recipes_on_commit(pk_set)
+    else:
+        transaction.on_commit(recipe_cache.bump_generation)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_reference_data(sender, **kwargs):
+    transaction.on_commit(recipe_cache.bump_generation)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(sender, instance, created, update_fields,
+                              **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    recipe_cache.bump_recipes_on_commit(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_index(sender, **kwargs):
+    transaction.on_commit(tag_index.invalidate)
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite_added(sender, instance, created, **kwargs):
+    if created:
+        increment(Recipe, instance.recipe_id, 'favorites_count')
+
+
+@receiver(post_delete, sender=Favorite)
+def count_favorite_removed(sender, instance, **kwargs):
+    increment(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def count_cart_added(sender, instance, created, **kwargs):
+    if created:
+        increment(Recipe, instance.recipe_id, 'carts_count')
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def count_cart_removed(sender, instance, **kwargs):
+    increment(Recipe, instance.recipe_id, 'carts_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        increment(User, instance.author_id, 'recipes_count')
+
+
+@receiver(post_delete, sender=Recipe)
+def count_recipe_removed(sender, instance, **kwargs):
+    increment(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_ingredient_amount(sender, instance, **kwargs):
+    instance._previous_amount = None
+    if instance.pk is not None:
+        instance._previous_amount = IngredientRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def update_shopping_lists(sender, instance, **kwargs):
+    deltas = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, '_previous_amount', None)
+    if previous is not None:
+        ingredient_id, amount = previous
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    shopping_list.apply_ingredient_deltas(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def shrink_shopping_lists(sender, instance, **kwargs):
+    shopping_list.apply_ingredient_deltas(
+        instance.recipe_id, {instance.ingredient_id: -instance.amount}
+    )
+
+
+VERSIONED_MODELS = (
+    Tag, Ingredient, Recipe, IngredientRecipe, Favorite, ShoppingCart,
+    Follow,
+)
+
+
+def bump_version(sender, **kwargs):
+    bump_model_version_on_commit(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_version, sender=model)
+    post_delete.connect(bump_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_model_version_on_commit(Recipe)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_model_version_on_commit(User)
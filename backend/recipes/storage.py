@@ -0,0 +1,31 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 20
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Сохраняет файлы под именем из хэша содержимого. Файл по такому имени
+    никогда не меняется, поэтому его можно кэшировать навсегда,
+    а повторная загрузка той же картинки не создаёт копию.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, content_hash(content) + extension)
+        if self.exists(name):
+            return name.replace('\\', '/')
+        return super().save(name, content, max_length)
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from .models import Tag
+
+VERSION_KEY = 'recipes:tags:version'
+
+
+class TagIndex:
+    """
+    Соответствие slug → id тегов в памяти процесса: фильтр рецептов
+    по тегам не читает таблицу тегов на каждый запрос. Сверяется
+    с версией в кэше default, которую сбрасывают сигналы Tag; другие
+    воркеры видят сброс, только если этот кэш общий
+    (см. foodgram/caches.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = None
+        self._version = None
+
+    def build(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        ids = dict(Tag.objects.values_list('slug', 'id'))
+        with self._lock:
+            self._ids, self._version = ids, version
+        return ids
+
+    def warm(self):
+        try:
+            self.build()
+        except DatabaseError:
+            self.invalidate(local_only=True)
+
+    def invalidate(self, local_only=False):
+        with self._lock:
+            self._ids = None
+        if not local_only:
+            try:
+                cache.incr(VERSION_KEY)
+            except ValueError:
+                # Как в индексе ингредиентов: потерянная версия не должна
+                # совпасть с уже известной другим воркерам.
+                cache.set(VERSION_KEY, time.time_ns(), None)
+
+    def _ensure_fresh(self):
+        ids = self._ids
+        if ids is None or cache.get(VERSION_KEY) != self._version:
+            ids = self.build()
+        return ids
+
+    def resolve(self, slugs):
+        """id известных тегов и признак того, что нашлись все slug."""
+        ids = self._ensure_fresh()
+        found = {ids[slug] for slug in slugs if slug in ids}
+        return found, len(found) == len(set(slugs))
+
+
+tag_index = TagIndex()
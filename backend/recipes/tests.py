@@ -1,3 +1,1393 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from foodgram.caches import check_shared_caches, ensure_shared
+from foodgram.db import check_connections
+from foodgram.middleware import QueryInstrumentationMiddleware
+from users.models import Follow, User
+
+from . import cache as recipe_cache
+from . import conditional, images
+from .asynchronous import async_read_view
+from .ingredient_index import VERSION_KEY as INGREDIENT_INDEX_KEY
+from .management.commands.explain_queries import (endpoints, explain,
+                                                 index_names, problems,
+                                                 walk)
+from . import shopping_list
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, ShoppingListItem, Tag)
+from .serializers import RecipeSerializer
+from .storage import HashedMediaStorage
+from .tag_index import VERSION_KEY as TAG_INDEX_KEY
+from .views import RecipeViewSet, TagViewSet
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Маршруты для AsyncReadViewTest: обёртка подключается независимо
+# от ASYNC_READ_VIEWS.
+urlpatterns = [
+    path('api/tags/', async_read_view(TagViewSet.as_view({'get': 'list'}))),
+    path('api/recipes/<int:pk>/', async_read_view(
+        RecipeViewSet.as_view({'get': 'retrieve'})
+    )),
+]
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='Secret-123', first_name=username, last_name=username,
+    )
+
+
+def create_recipe(author, name, ingredients, tags=(), text=None):
+    """ingredients — {ингредиент: количество}."""
+    recipe = Recipe.objects.create(
+        author=author, name=name, text=text or name, cooking_time=10,
+        image='media/recipes/images/test.png',
+    )
+    recipe.tags.set(tags)
+    for ingredient, amount in ingredients.items():
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=amount
+        )
+    return recipe
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+class RecipeDataMixin:
+    """Автор с рецептами, читатель с избранным, корзиной и подпиской."""
+    recipes_count = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tags = [
+            Tag.objects.create(name=slug, color=color, slug=slug)
+            for slug, color in (('breakfast', '#E26C2D'),
+                                ('dinner', '#49B64E'))
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'соль', 'масло')
+        ]
+        cls.recipes = [
+            create_recipe(
+                cls.author, f'рецепт {index}',
+                {cls.ingredients[index % 4]: 100,
+                 cls.ingredients[(index + 1) % 4]: 50},
+                cls.tags[:index % 2 + 1],
+            )
+            for index in range(cls.recipes_count)
+        ]
+        for recipe in cls.recipes[:3]:
+            Favorite.objects.create(user=cls.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        clear_caches()
+
+
+class QueryCountTest(RecipeDataMixin, APITestCase):
+    """Число запросов не зависит от размера страницы."""
+
+    def test_recipe_list(self):
+        for limit in (3, 6):
+            clear_caches()
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_recipe_list_authorized(self):
+        self.client.force_authenticate(self.reader)
+        for limit in (3, 6):
+            clear_caches()
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+        response = self.client.get('/api/recipes/?limit=10')
+        flagged = [
+            recipe['id'] for recipe in response.data['results']
+            if recipe['is_favorited'] and recipe['is_in_shopping_cart']
+        ]
+        self.assertEqual(
+            sorted(flagged), sorted(recipe.pk for recipe in self.recipes[:3])
+        )
+
+    def test_recipe_detail(self):
+        self.client.force_authenticate(self.reader)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['ingredients']), 2)
+
+    def test_subscriptions(self):
+        other = create_user('other')
+        create_recipe(other, 'чужой рецепт', {self.ingredients[0]: 10})
+        Follow.objects.create(user=self.reader, author=other)
+        self.client.force_authenticate(self.reader)
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/?recipes_limit=2'
+            )
+        self.assertEqual(response.data['count'], 2)
+        previews = {
+            author['username']: len(author['recipes'])
+            for author in response.data['results']
+        }
+        self.assertEqual(previews, {'author': 2, 'other': 1})
+
+    def test_download_shopping_cart(self):
+        self.client.force_authenticate(self.reader)
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/'
+            )
+            content = b''.join(response.streaming_content).decode()
+        self.assertIn('мука - 100 г', content)
+
+
+class SubscriptionsTest(RecipeDataMixin, APITestCase):
+    """Превью рецептов подписок загружаются одним запросом."""
+    url = '/api/users/subscriptions/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def test_recipes_limit(self):
+        response = self.client.get(self.url, {'recipes_limit': 2})
+        author = response.data['results'][0]
+        self.assertEqual(
+            [recipe['id'] for recipe in author['recipes']],
+            [recipe.pk for recipe in self.recipes[:-3:-1]],
+        )
+        self.assertEqual(author['recipes_count'], self.recipes_count)
+        self.assertTrue(author['is_subscribed'])
+
+    def test_invalid_recipes_limit_is_ignored(self):
+        for limit in ('abc', '-1'):
+            with self.subTest(limit=limit):
+                response = self.client.get(self.url, {'recipes_limit': limit})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    len(response.data['results'][0]['recipes']),
+                    self.recipes_count,
+                )
+
+    def test_no_subscriptions(self):
+        self.client.force_authenticate(self.author)
+        for params in ({'recipes_limit': 2}, {'recipes_limit': 2,
+                                              'cursor': ''}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['results'], [])
+
+
+class DownloadShoppingCartTest(RecipeDataMixin, APITestCase):
+    """Выгрузка списка покупок в трёх форматах с ETag."""
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        self.assertEqual(self.download().decode(), (
+            '1. масло - 50 г\n2. мука - 100 г\n'
+            '3. сахар - 150 г\n4. соль - 150 г\n'
+        ))
+
+    def test_csv(self):
+        lines = self.download(format='csv').decode().splitlines()
+        self.assertEqual(lines[0], 'Ингредиент,Количество,Единица измерения')
+        self.assertEqual(lines[1:3], ['масло,50,г', 'мука,100,г'])
+
+    def test_pdf(self):
+        self.assertTrue(self.download(format='pdf').startswith(b'%PDF'))
+
+    def test_empty_cart(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.download().decode(), 'Список покупок пуст\n')
+
+    def test_unknown_format(self):
+        response = self.client.get(self.url, {'format': 'xls'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(
+            self.client.get(self.url, {'format': 'csv'})['ETag'], etag
+        )
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipes[3])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConditionalGetTest(RecipeDataMixin, APITestCase):
+    """304 по версиям моделей и Last-Modified только за прошедшие секунды."""
+    # Середина секунды: до её конца Last-Modified ещё не известен.
+    now = 1_700_000_000_500_000_000
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+        self.url = f'/api/recipes/{self.recipes[5].pk}/'
+
+    def at(self, seconds):
+        return mock.patch(
+            'time.time_ns', return_value=self.now + int(seconds * 10 ** 9)
+        )
+
+    def test_if_none_match(self):
+        self.client.force_authenticate(None)
+        etag = self.client.get('/api/recipes/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{self.url}favorite/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since_sees_changes_within_a_second(self):
+        with self.at(0):
+            conditional.bump_model_version(*RecipeViewSet.etag_models)
+            self.assertFalse(self.client.get(self.url).has_header(
+                'Last-Modified'
+            ))
+        with self.at(2):
+            last_modified = self.client.get(self.url)['Last-Modified']
+            self.assertEqual(
+                last_modified, http_date(self.now // 10 ** 9 + 1)
+            )
+            response = self.client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_304_NOT_MODIFIED
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'{self.url}favorite/')
+            response = self.client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_favorited'])
+
+
+class ResponseCacheTest(APITestCase):
+    """Готовые JSON-ответы тегов отдаются без запросов к базе."""
+    url = '/api/tags/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='breakfast', color='#E26C2D', slug='breakfast'
+        )
+
+    def setUp(self):
+        clear_caches()
+
+    def test_hit_skips_database(self):
+        content = self.client.get(self.url).content
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.content, content)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    def test_tag_change_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'завтрак'
+            self.tag.save()
+        self.assertEqual(self.client.get(self.url).data[0]['name'], 'завтрак')
+
+    @override_settings(STATICFILES_STORAGE=(
+        'django.contrib.staticfiles.storage.StaticFilesStorage'
+    ))
+    def test_html_is_not_cached(self):
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, HTTP_ACCEPT='text/html')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(queries.captured_queries)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadViewTest(RecipeDataMixin, TestCase):
+    """ETag и кэш ответов в async_read_view отвечают без обращения к базе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def auth(self, key=None):
+        return {'Authorization': f'Token {key or self.token.key}'}
+
+    async def get_counting_queries(self, path, **headers):
+        """
+        (ответ, SQL запросов к базе). В assertNumQueries нельзя войти
+        из async-кода, а соединение с базой живёт в основном потоке,
+        поэтому и подсчёт включается и читается там же.
+        """
+        captured = CaptureQueriesContext(connection)
+
+        def stop():
+            captured.__exit__(None, None, None)
+            return [query['sql'] for query in captured.captured_queries]
+
+        await sync_to_async(captured.__enter__)()
+        try:
+            response = await self.async_client.get(path, **headers)
+        finally:
+            queries = await sync_to_async(stop)()
+        return response, queries
+
+    async def test_anonymous_not_modified(self):
+        response = await self.async_client.get('/api/tags/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        response, queries = await self.get_counting_queries(
+            '/api/tags/', **{'If-None-Match': etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(queries, [])
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_anonymous_cached_response(self):
+        first = await self.async_client.get('/api/tags/')
+        second, queries = await self.get_counting_queries('/api/tags/')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+        self.assertEqual(second.content, first.content)
+
+    async def test_valid_token(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        response, queries = await self.get_counting_queries(
+            url, **self.auth()
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['is_favorited'])
+        # Исходное представление получает уже найденного пользователя.
+        self.assertEqual(
+            len([sql for sql in queries if 'authtoken_token' in sql]), 1
+        )
+        anonymous = await self.async_client.get(url)
+        self.assertFalse(anonymous.json()['is_favorited'])
+        self.assertNotEqual(anonymous['ETag'], response['ETag'])
+        # Токен уже в token_cache, ETag сверяется по версиям в кэше.
+        response, queries = await self.get_counting_queries(
+            url, **self.auth(), **{'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(queries, [])
+
+    async def test_invalid_token(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        response = await self.async_client.get(url, **self.auth('x' * 40))
+        self.assertEqual(
+            response.status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+    def rename_tag(self):
+        tag = self.tags[1]
+        tag.name = 'ужин'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+
+    async def test_changed_data_is_served_again(self):
+        response = await self.async_client.get('/api/tags/')
+        etag = response['ETag']
+        await sync_to_async(self.rename_tag)()
+        response = await self.async_client.get(
+            '/api/tags/', **{'If-None-Match': etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('ужин', [tag['name'] for tag in response.json()])
+
+
+class ShoppingListTest(RecipeDataMixin, APITestCase):
+    """Списки покупок, которые ведутся по ходу, совпадают с пересчётом."""
+
+    def totals(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient__name', 'total_amount'
+        ))
+
+    def test_incremental_maintenance_matches_verify(self):
+        self.assertEqual(
+            self.totals(self.reader),
+            {'мука': 100, 'сахар': 150, 'соль': 150, 'масло': 50},
+        )
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipes[3])
+        ShoppingCart.objects.create(user=self.author, recipe=self.recipes[0])
+        ShoppingCart.objects.filter(
+            user=self.reader, recipe__in=self.recipes[:2]
+        ).delete()
+        row = self.recipes[2].ingredient_to_recipe.get(
+            ingredient=self.ingredients[2]
+        )
+        row.amount = 1
+        row.save()
+        self.recipes[3].ingredient_to_recipe.get(
+            ingredient=self.ingredients[3]
+        ).delete()
+        self.assertEqual(shopping_list.verify(), [])
+        self.assertEqual(
+            self.totals(self.reader), {'мука': 50, 'соль': 1, 'масло': 50}
+        )
+        self.assertEqual(self.totals(self.author), {'мука': 100, 'сахар': 50})
+
+    def test_verify_reports_and_fixes_drift(self):
+        ShoppingListItem.objects.filter(user=self.reader).update(
+            total_amount=1
+        )
+        mismatches = shopping_list.verify()
+        self.assertEqual(len(mismatches), 4)
+        self.assertEqual(
+            {user_id for user_id, *_ in mismatches}, {self.reader.pk}
+        )
+        shopping_list.verify(fix=True)
+        self.assertEqual(shopping_list.verify(), [])
+        output = StringIO()
+        call_command('verify_shopping_lists', stdout=output)
+        self.assertIn('Расхождений нет', output.getvalue())
+
+    def test_shopping_list_endpoint(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['name'], item['amount']) for item in response.data],
+            [('масло', 50), ('мука', 100), ('сахар', 150), ('соль', 150)],
+        )
+
+
+class UpdateIngredientsTest(RecipeDataMixin, APITestCase):
+    """Состав рецепта меняется по разнице, а не удалением всех строк."""
+
+    def test_diff(self):
+        recipe = self.recipes[0]
+        flour, sugar, salt, butter = self.ingredients
+        rows = {
+            row.ingredient_id: row.pk
+            for row in recipe.ingredient_to_recipe.all()
+        }
+        changed = RecipeSerializer.update_ingredients(recipe, [
+            {'id': flour.pk, 'amount': 100},
+            {'id': salt.pk, 'amount': 5},
+        ])
+        self.assertTrue(changed)
+        self.assertEqual(
+            dict(recipe.ingredient_to_recipe.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {flour.pk: 100, salt.pk: 5},
+        )
+        self.assertEqual(
+            recipe.ingredient_to_recipe.get(ingredient=flour).pk,
+            rows[flour.pk],
+        )
+        self.assertEqual(shopping_list.verify(), [])
+
+    def test_amount_is_updated_in_place(self):
+        recipe = self.recipes[0]
+        row = recipe.ingredient_to_recipe.get(ingredient=self.ingredients[0])
+        RecipeSerializer.update_ingredients(recipe, [
+            {'id': self.ingredients[0].pk, 'amount': 300},
+            {'id': self.ingredients[1].pk, 'amount': 50},
+        ])
+        row.refresh_from_db()
+        self.assertEqual(row.amount, 300)
+        self.assertEqual(shopping_list.verify(), [])
+
+    def test_unchanged_ingredients_are_not_written(self):
+        recipe = self.recipes[0]
+        with self.assertNumQueries(1):
+            changed = RecipeSerializer.update_ingredients(recipe, [
+                {'id': self.ingredients[1].pk, 'amount': 50},
+                {'id': self.ingredients[0].pk, 'amount': 100},
+            ])
+        self.assertFalse(changed)
+
+    def test_patch_keeps_omitted_ingredients_and_tags(self):
+        recipe = self.recipes[1]
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', {'name': 'новое'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(recipe.ingredient_to_recipe.count(), 2)
+        self.assertEqual(recipe.tags.count(), 2)
+
+
+@override_settings(USE_X_ACCEL_REDIRECT=True)
+class AccelRedirectTest(RecipeDataMixin, APITestCase):
+    """Файл выгрузки пишется один раз на ETag и отдаётся через nginx."""
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        override = override_settings(PROTECTED_MEDIA_ROOT=root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.root = root.name
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'')
+        location = response['X-Accel-Redirect']
+        self.assertTrue(location.startswith('/protected/shopping_lists/'))
+        return os.path.join(self.root, location[len('/protected/'):])
+
+    def test_file_is_written_once_per_etag(self):
+        path = self.export()
+        with open(path, encoding='utf-8') as file:
+            self.assertIn('2. мука - 100 г', file.read())
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.export(), path)
+        self.assertEqual(os.listdir(os.path.dirname(path)),
+                         [os.path.basename(path)])
+
+    def test_stale_files_are_removed_after_a_grace_period(self):
+        old = self.export()
+        pdf = self.export(format='pdf')
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipes[3])
+        fresh = self.export()
+        self.assertTrue(os.path.exists(old))
+        hour_ago = timezone.now().timestamp() - 3600
+        os.utime(old, (hour_ago, hour_ago))
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipes[4])
+        newest = self.export()
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(newest))),
+            sorted(os.path.basename(path) for path in (fresh, newest, pdf)),
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class HashedMediaStorageTest(TestCase):
+    """Имя файла — хэш содержимого: одинаковые загрузки не копируются."""
+
+    def test_name_is_content_hash(self):
+        storage = HashedMediaStorage()
+        first = storage.save('images/a.PNG', ContentFile(b'one'))
+        again = storage.save('images/b.png', ContentFile(b'one'))
+        other = storage.save('images/c.png', ContentFile(b'two'))
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^images/[0-9a-f]{20}\.png$')
+
+
+class PayloadCacheTest(RecipeDataMixin, APITestCase):
+    """Общие карточки рецептов берутся из кэша, флаги — свои у каждого."""
+
+    def flags(self, data):
+        return {
+            recipe['id']: (recipe['is_favorited'],
+                           recipe['is_in_shopping_cart'],
+                           recipe['author']['is_subscribed'])
+            for recipe in data['results']
+        }
+
+    def test_payloads_are_reused(self):
+        self.client.get('/api/recipes/?limit=6')
+        self.assertEqual(recipe_cache.get_stats()['misses'], 6)
+        self.client.get('/api/recipes/?limit=6')
+        self.assertEqual(recipe_cache.get_stats()['hits'], 6)
+
+    def test_user_fields_are_overlaid(self):
+        self.client.force_authenticate(self.reader)
+        self.client.get('/api/recipes/?limit=10')
+        self.client.force_authenticate(None)
+        anonymous = self.flags(self.client.get('/api/recipes/?limit=10').data)
+        self.assertEqual(recipe_cache.get_stats()['hits'], 8)
+        self.assertEqual(set(anonymous.values()), {(False, False, False)})
+        self.client.force_authenticate(self.reader)
+        flags = self.flags(self.client.get('/api/recipes/?limit=10').data)
+        for recipe in self.recipes:
+            with self.subTest(recipe=recipe.name):
+                marked = recipe in self.recipes[:3]
+                self.assertEqual(flags[recipe.pk], (marked, marked, True))
+
+    def test_recipe_change_invalidates_payload(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.pk}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'новое название'
+            recipe.save()
+        self.assertEqual(self.client.get(url).data['name'], 'новое название')
+
+    def test_tag_change_invalidates_all_payloads(self):
+        self.client.get('/api/recipes/?limit=10')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].name = 'завтрак'
+            self.tags[0].save()
+        response = self.client.get('/api/recipes/?limit=10')
+        self.assertEqual(recipe_cache.get_stats()['hits'], 0)
+        names = {
+            tag['name'] for recipe in response.data['results']
+            for tag in recipe['tags']
+        }
+        self.assertEqual(names, {'завтрак', 'dinner'})
+
+
+class CursorPaginationTest(RecipeDataMixin, APITestCase):
+    """Курсор проходит ленту в обе стороны без пропусков и повторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        # Пары рецептов с одинаковой датой попадают на границы страниц
+        # по три: порядок по id не должен терять или повторять записи.
+        minutes = (0, 1, 2, 2, 3, 4, 4, 5)
+        for recipe, offset in zip(cls.recipes, minutes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(minutes=offset)
+            )
+        cls.expected = list(Recipe.objects.order_by(
+            '-pub_date', 'id'
+        ).values_list('id', flat=True))
+
+    def walk(self, url, link, key='id'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item[key] for item in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_forward_and_back(self):
+        forward = self.walk('/api/recipes/?limit=3&cursor=', 'next')
+        self.assertEqual(
+            [pk for page in forward for pk in page], self.expected
+        )
+        self.assertEqual([len(page) for page in forward], [3, 3, 2])
+        last = self.client.get('/api/recipes/?limit=3&cursor=')
+        for _ in range(len(forward) - 1):
+            last = self.client.get(last.data['next'])
+        self.assertIsNone(last.data['next'])
+        back = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(back, forward[-2::-1])
+
+    def test_first_page_has_no_previous_link(self):
+        response = self.client.get('/api/recipes/?limit=3&cursor=')
+        self.assertIsNone(response.data['previous'])
+        self.assertNotIn('count', response.data)
+
+    def test_bad_cursor(self):
+        garbage = base64.urlsafe_b64encode(b'[1, 2').decode()
+        for cursor in ('%%%', garbage, 'bm90IGpzb24'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(
+                    response.status_code, status.HTTP_404_NOT_FOUND
+                )
+
+    def test_subscriptions(self):
+        for username in ('carol', 'bob', 'dave'):
+            Follow.objects.create(
+                user=self.reader, author=create_user(username)
+            )
+        self.client.force_authenticate(self.reader)
+        pages = self.walk(
+            '/api/users/subscriptions/?limit=2&cursor=', 'next', 'username'
+        )
+        self.assertEqual(
+            pages, [['author', 'bob'], ['carol', 'dave']]
+        )
+
+
+class CountersTest(RecipeDataMixin, APITestCase):
+    """Счётчики обновляются сигналами и пересчитываются командой."""
+
+    def test_signals_maintain_counters(self):
+        recipe = self.recipes[0]
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual((recipe.favorites_count, recipe.carts_count), (1, 1))
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (8, 1)
+        )
+        Favorite.objects.filter(recipe=recipe).delete()
+        Follow.objects.all().delete()
+        create_recipe(self.author, 'ещё рецепт', {self.ingredients[0]: 1})
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (9, 0)
+        )
+
+    def test_rebuild_repairs_drift(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+        out = StringIO()
+        call_command('rebuild_counters', '--dry-run', stdout=out)
+        self.assertIn('recipes.Recipe.favorites_count: расхождений - 1',
+                      out.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 5)
+        call_command('rebuild_counters', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_ordering(self):
+        response = self.client.get(
+            '/api/recipes/', {'ordering': '-favorites_count', 'limit': 3}
+        )
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response.data['results']),
+            sorted(recipe.pk for recipe in self.recipes[:3]),
+        )
+        response = self.client.get(
+            '/api/recipes/', {'ordering': '-favorites_count', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchTest(RecipeDataMixin, APITestCase):
+    """Поиск: все слова запроса, совпадения в названии выше, чем в тексте."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        flour = {cls.ingredients[0]: 100}
+        cls.in_text = create_recipe(
+            cls.author, 'суп дня', flour, text='почти как борщ'
+        )
+        cls.in_name = create_recipe(
+            cls.author, 'борщ красный', flour, cls.tags[1:], text='свёкла'
+        )
+        create_recipe(cls.reader, 'каша', flour, text='крупа и вода')
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_ranks_above_text(self):
+        self.assertEqual(
+            self.search('борщ'), [self.in_name.pk, self.in_text.pk]
+        )
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('борщ красный'), [self.in_name.pk])
+
+    def test_combines_with_filters(self):
+        self.assertEqual(
+            self.search('борщ', tags='dinner'), [self.in_name.pk]
+        )
+        self.assertEqual(self.search('каша', author=self.author.pk), [])
+
+    def test_cursor_is_rejected(self):
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IngredientIndexTest(APITestCase):
+    """Подсказки ингредиентов: сначала префикс, затем вхождение подстроки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('ванильный сахар', 'Сахар', 'сахарная пудра', 'соль',
+                     'Свёкла', 'мука'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        clear_caches()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(
+            self.search('сах'),
+            ['Сахар', 'сахарная пудра', 'ванильный сахар'],
+        )
+
+    def test_case_and_yo_are_ignored(self):
+        self.assertEqual(self.search('  СВЕК'), ['Свёкла'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_limit(self):
+        self.assertEqual(self.search('с'), ['Сахар', 'сахарная пудра'])
+
+    def test_new_ingredient_invalidates_index(self):
+        self.assertEqual(self.search('сол'), ['соль'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='солод', measurement_unit='г')
+        self.assertEqual(self.search('сол'), ['солод', 'соль'])
+
+    def test_lost_version_rebuilds_index(self):
+        self.assertEqual(self.search('мук'), ['мука'])
+        Ingredient.objects.filter(name='мука').update(name='мука ржаная')
+        clear_caches()
+        self.assertEqual(self.search('мук'), ['мука ржаная'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WIDTHS=(50, 400))
+class ImageVariantsTest(RecipeDataMixin, APITestCase):
+    """Уменьшенные копии изображений и srcset по ним."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def save_image(self, name, image, **options):
+        path = os.path.join(MEDIA_ROOT, 'media', 'recipes', 'images', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image.save(path, **options)
+        name = f'media/recipes/images/{name}'
+        Recipe.objects.filter(pk=self.recipe.pk).update(image=name)
+        images.process_recipe_image(self.recipe.pk, name, mode='sync')
+        self.recipe.refresh_from_db()
+        return self.recipe.image_variants
+
+    def open_variant(self, name):
+        return Image.open(os.path.join(MEDIA_ROOT, name))
+
+    def test_variants_and_srcset(self):
+        variants = self.save_image(
+            'photo.png', Image.new('RGBA', (200, 100), (255, 0, 0, 128))
+        )
+        self.assertEqual(set(variants), {'50', '200'})
+        for width, files in variants.items():
+            for extension, name in files.items():
+                with self.subTest(width=width, extension=extension):
+                    with self.open_variant(name) as variant:
+                        self.assertEqual(variant.format.lower(), extension)
+                        self.assertEqual(variant.width, int(width))
+        srcset = self.client.get(self.url).data['image_srcset']
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertRegex(srcset['webp'], r'_50\.\w+\.webp 50w')
+        self.assertRegex(srcset['webp'], r'_200\.\w+\.webp 200w')
+
+    def test_exif_orientation_is_applied_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        variants = self.save_image(
+            'rotated.jpg', Image.new('RGB', (200, 100)), format='JPEG',
+            exif=exif,
+        )
+        with self.open_variant(variants['50']['jpeg']) as variant:
+            self.assertEqual(variant.size, (50, 100))
+            self.assertEqual(len(variant.getexif()), 0)
+
+    def test_original_until_processed(self):
+        srcset = self.client.get(self.url).data['image_srcset']
+        self.assertEqual(list(srcset), ['original'])
+        self.assertTrue(srcset['original'].endswith('test.png'))
+
+    def test_replaced_image_keeps_its_own_variants(self):
+        images.store_variants(
+            self.recipe.pk, 'media/recipes/images/old.png', {'50': {}}
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+
+class ImportCsvTest(TestCase):
+    """Повторная загрузка ингредиентов ничего не дублирует и не удаляет."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('importcsv', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reimport_is_idempotent(self):
+        path = self.write('ingredients.csv', 'мука,г\nсоль,г\nмука,г\n')
+        self.assertIn('добавлено: 2, уже есть в базе (пропущено): 0',
+                      self.load(path))
+        flour = Ingredient.objects.get(name='мука')
+        recipe = create_recipe(create_user('author'), 'хлеб', {flour: 500})
+        output = self.load(path)
+        self.assertIn('добавлено: 0, уже есть в базе (пропущено): 2', output)
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(recipe.ingredient_to_recipe.get().ingredient, flour)
+
+    def test_json_and_new_unit(self):
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'мука', 'measurement_unit': 'кг'},
+            {'name': 'мука', 'measurement_unit': 'г'},
+        ]))
+        output = self.load(path)
+        self.assertIn('добавлено: 1, уже есть в базе (пропущено): 1', output)
+        self.assertIn('известные названия с новой единицей: 1', output)
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write('ingredients.csv', 'мука,г\n')
+        output = self.load(path, '--dry-run')
+        self.assertIn('+ мука, г', output)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            self.load(self.write('ingredients.xml', ''))
+
+
+class SharedCacheCheckTest(TestCase):
+    """Кэш в памяти процесса: предупреждение и отказ запускать воркеры."""
+
+    def test_process_local_cache_is_reported(self):
+        warnings = check_shared_caches(None)
+        self.assertEqual([warning.id for warning in warnings],
+                         ['foodgram.W001'])
+
+    @override_settings(CACHES={
+        alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        for alias in ('default', 'responses')
+    })
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_caches(None), [])
+        ensure_shared(workers=4)
+
+    def test_several_workers_refuse_process_local_cache(self):
+        ensure_shared(workers=1)
+        with self.assertRaises(RuntimeError):
+            ensure_shared(workers=2)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'обёртка бэкенда подключается только для PostgreSQL')
+class HealthCheckTest(TransactionTestCase):
+    """Постоянное соединение проверяется перед первым запросом к базе."""
+
+    def setUp(self):
+        clear_caches()
+        connection.ensure_connection()
+        check_connections()
+
+    def test_checked_once_before_first_query(self):
+        with mock.patch.object(connection, 'is_usable',
+                               return_value=True) as is_usable:
+            self.assertEqual(is_usable.call_count, 0)
+            Tag.objects.count()
+            Tag.objects.count()
+        self.assertEqual(is_usable.call_count, 1)
+
+    def test_request_without_queries_is_not_checked(self):
+        with mock.patch.object(connection, 'is_usable') as is_usable:
+            check_connections()
+        is_usable.assert_not_called()
+
+    def test_broken_connection_is_replaced(self):
+        broken = connection.connection
+        with mock.patch.object(connection, 'is_usable', return_value=False):
+            Tag.objects.count()
+        self.assertIsNot(connection.connection, broken)
+
+    def test_new_request_checks_again(self):
+        with mock.patch.object(connection, 'is_usable',
+                               return_value=True) as is_usable:
+            self.client.get('/api/recipes/')
+            self.client.get('/api/recipes/')
+        self.assertEqual(is_usable.call_count, 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN только в PostgreSQL')
+class ExplainQueriesTest(RecipeDataMixin, TestCase):
+    """Планы горячих запросов: ни один не читает горячую таблицу целиком."""
+    recipes_count = 40
+
+    def test_hot_queries_do_not_scan_whole_tables(self):
+        for path, user in endpoints(self.reader):
+            for sql, plan in explain(path, user):
+                with self.subTest(path=path, sql=sql[:200]):
+                    self.assertEqual(problems(plan), [])
+
+    def test_recipe_list_walks_pub_date_index(self):
+        used = set()
+        for _, plan in explain('/api/recipes/?limit=20&cursor='):
+            used |= index_names(plan)
+        self.assertIn('recipe_pub_date_id_idx', used)
+
+    def test_author_filter_uses_author_index(self):
+        used = set()
+        for _, plan in explain(f'/api/recipes/?author={self.author.pk}'):
+            used |= index_names(plan)
+        self.assertIn('recipe_author_pub_date_idx', used)
+
+    def test_favorites_filter_uses_user_index(self):
+        favorites = Favorite._meta.db_table
+        conditions = [
+            node.get('Index Cond', '') + node.get('Recheck Cond', '')
+            for _, plan in explain('/api/recipes/?is_favorited=1',
+                                   self.reader)
+            for node, _ in walk(plan)
+            if node.get('Relation Name') == favorites
+            or node.get('Index Name', '').startswith(favorites)
+        ]
+        self.assertTrue(conditions)
+        self.assertTrue(all('user_id' in cond for cond in conditions))
+
+
+@override_settings(QUERY_INSTRUMENTATION=True, SLOW_REQUEST_MS=10 ** 6)
+class QueryInstrumentationTest(RecipeDataMixin, APITestCase):
+    """Счётчик запросов: заголовки для сотрудников и предупреждения в логе."""
+
+    def test_staff_gets_query_headers(self):
+        staff = create_user('staff')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", '
+                         r'app;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_other_users_get_no_headers(self):
+        for user in (None, self.reader):
+            self.client.force_authenticate(user)
+            response = self.client.get('/api/recipes/')
+            self.assertNotIn('X-Query-Count', response)
+            self.assertNotIn('Server-Timing', response)
+
+    def test_recipe_list_has_no_repeated_queries(self):
+        self.client.force_authenticate(self.reader)
+        with self.assertNoLogs('foodgram.queries', 'WARNING'):
+            self.client.get('/api/recipes/?limit=20')
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_query_is_logged_as_n_plus_one(self):
+        def view(request):
+            for recipe in self.recipes[:3]:
+                Recipe.objects.get(pk=recipe.pk)
+            return HttpResponse()
+
+        middleware = QueryInstrumentationMiddleware(view)
+        with self.assertLogs('foodgram.queries', 'WARNING') as logs:
+            middleware(RequestFactory().get('/api/recipes/'))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Возможный N+1', logs.output[0])
+        self.assertIn('3 раз', logs.output[0])
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_is_logged(self):
+        with self.assertLogs('foodgram.queries', 'WARNING') as logs:
+            self.client.get('/api/recipes/')
+        self.assertIn('Медленный запрос GET /api/recipes/', logs.output[-1])
+
+    @override_settings(QUERY_INSTRUMENTATION=False)
+    def test_disabled_middleware_leaves_the_chain(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryInstrumentationMiddleware(lambda request: HttpResponse())
+
+
+class SeedDataTest(RecipeDataMixin, APITestCase):
+    """seed_data пишет в обход сигналов, но сбрасывает версии в кэшах."""
+    options = {
+        'users': 3, 'recipes': 5, 'tags': 2, 'ingredients_per_recipe': 2,
+        'favorites_per_user': 1, 'carts_per_user': 1, 'follows_per_user': 1,
+    }
+
+    def seed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_data', stdout=StringIO(), **self.options)
+
+    def test_cached_responses_see_seeded_rows(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.client.get('/api/tags/')
+        self.seed()
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], self.recipes_count + 5)
+        self.assertIn('tag-0', [
+            tag['slug'] for tag in self.client.get('/api/tags/').json()
+        ])
+
+    def test_versions_are_bumped(self):
+        self.client.get('/api/ingredients/')
+        generation = recipe_cache.get_generation()
+        versions = conditional.get_model_versions(RecipeViewSet.etag_models)
+        self.client.get('/api/recipes/?tags=dinner')
+        index_version = caches['default'].get(INGREDIENT_INDEX_KEY)
+        tag_index_version = caches['default'].get(TAG_INDEX_KEY)
+        self.seed()
+        self.assertNotEqual(recipe_cache.get_generation(), generation)
+        self.assertNotEqual(
+            conditional.get_model_versions(RecipeViewSet.etag_models),
+            versions,
+        )
+        self.assertNotEqual(
+            caches['default'].get(INGREDIENT_INDEX_KEY), index_version
+        )
+        self.assertNotEqual(
+            caches['default'].get(TAG_INDEX_KEY), tag_index_version
+        )
+
+
+class TagFilterTest(RecipeDataMixin, APITestCase):
+    """Фильтр по тегам: любой или все теги, slug из индекса в памяти."""
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        return set(ids)
+
+    def test_any_tag(self):
+        self.assertEqual(
+            self.get_ids('tags=breakfast&tags=dinner'),
+            {recipe.pk for recipe in self.recipes},
+        )
+        self.assertEqual(
+            self.get_ids('tags=dinner'),
+            {recipe.pk for recipe in self.recipes[1::2]},
+        )
+
+    def test_all_tags(self):
+        self.assertEqual(
+            self.get_ids('tags=breakfast&tags=dinner&tags_match=all'),
+            {recipe.pk for recipe in self.recipes[1::2]},
+        )
+
+    def test_unknown_slug(self):
+        self.assertEqual(
+            self.get_ids('tags=dinner&tags=unknown'),
+            {recipe.pk for recipe in self.recipes[1::2]},
+        )
+        self.assertEqual(
+            self.get_ids('tags=dinner&tags=unknown&tags_match=all'), set()
+        )
+        self.assertEqual(self.get_ids('tags=unknown'), set())
+
+    def test_slugs_are_resolved_without_queries(self):
+        self.get_ids('tags=dinner')
+        with CaptureQueriesContext(connection) as captured:
+            self.get_ids('tags=dinner&tags=breakfast')
+        # Ни вариантов фильтра (DISTINCT по рецептам), ни slug в условиях.
+        self.assertFalse([
+            query['sql'] for query in captured
+            if 'DISTINCT' in query['sql']
+            or '"recipes_tag"."slug" IN' in query['sql']
+        ])
+
+    def test_new_tag_is_found(self):
+        self.get_ids('tags=dinner')
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name='ужин', color='#000000',
+                                     slug='supper')
+            self.recipes[0].tags.add(tag)
+        self.assertEqual(self.get_ids('tags=supper'), {self.recipes[0].pk})
+
+    def test_lost_version_restarts_from_time(self):
+        self.get_ids('tags=dinner')
+        caches['default'].delete(TAG_INDEX_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='ужин', color='#000000', slug='supper')
+        self.assertGreater(caches['default'].get(TAG_INDEX_KEY), 10 ** 18)
+
+
+class ToggleTest(RecipeDataMixin, APITestCase):
+    """Ответы избранного, корзины и подписок при одном операторе в базе."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def test_favorite_and_shopping_cart(self):
+        recipe = self.recipes[5]
+        for action, counter in (('favorite', 'favorites_count'),
+                                ('shopping_cart', 'carts_count')):
+            url = f'/api/recipes/{recipe.pk}/{action}/'
+            with self.subTest(action=action):
+                response = self.client.post(url)
+                self.assertEqual(
+                    response.status_code, status.HTTP_201_CREATED
+                )
+                self.assertEqual(response.data['id'], recipe.pk)
+                self.assertEqual(
+                    self.client.post(url).status_code,
+                    status.HTTP_400_BAD_REQUEST,
+                )
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 1)
+                self.assertEqual(
+                    self.client.delete(url).status_code,
+                    status.HTTP_204_NO_CONTENT,
+                )
+                self.assertEqual(
+                    self.client.delete(url).status_code,
+                    status.HTTP_400_BAD_REQUEST,
+                )
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 0)
+        self.assertEqual(shopping_list.verify(), [])
+
+    def test_missing_recipe(self):
+        for action in ('favorite', 'shopping_cart'):
+            for pk in (10 ** 6, 'abc'):
+                with self.subTest(action=action, pk=pk):
+                    response = self.client.post(
+                        f'/api/recipes/{pk}/{action}/'
+                    )
+                    self.assertEqual(
+                        response.status_code, status.HTTP_404_NOT_FOUND
+                    )
+
+    def test_subscribe(self):
+        other = create_user('other')
+        url = f'/api/users/{other.pk}/subscribe/'
+        self.assertEqual(
+            self.client.post(url).status_code, status.HTTP_201_CREATED
+        )
+        self.assertEqual(
+            self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        other.refresh_from_db()
+        self.assertEqual(other.followers_count, 1)
+        self.assertEqual(
+            self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT
+        )
+        self.assertEqual(
+            self.client.delete(url).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        other.refresh_from_db()
+        self.assertEqual(other.followers_count, 0)
+
+    def test_subscribe_to_self_or_missing_author(self):
+        response = self.client.post(f'/api/users/{self.reader.pk}/subscribe/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f'/api/users/{10 ** 6}/subscribe/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Follow.objects.filter(user=self.reader).exclude(
+            author=self.author
+        ).exists())
+
+
+class BatchToggleTest(RecipeDataMixin, APITestCase):
+    """Пакетное избранное и корзина: {"ids": [...]} одним оператором."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def test_add_and_remove(self):
+        # recipes[:3] уже в избранном и корзине читателя.
+        ids = [recipe.pk for recipe in self.recipes[2:5]] + [10 ** 6]
+        for action, counter in (('favorite', 'favorites_count'),
+                                ('shopping_cart', 'carts_count')):
+            url = f'/api/recipes/{action}/'
+            with self.subTest(action=action):
+                response = self.client.post(url, {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data, {
+                    'added': sorted(ids[1:3]),
+                    'skipped': sorted([ids[0], ids[3]]),
+                })
+                self.recipes[3].refresh_from_db()
+                self.assertEqual(getattr(self.recipes[3], counter), 1)
+                response = self.client.delete(
+                    url, {'ids': ids}, format='json'
+                )
+                self.assertEqual(response.data, {
+                    'removed': sorted(ids[:3]),
+                    'skipped': [ids[3]],
+                })
+                self.recipes[3].refresh_from_db()
+                self.assertEqual(getattr(self.recipes[3], counter), 0)
+        self.assertEqual(shopping_list.verify(), [])
+
+    def test_invalid_ids(self):
+        for ids in ([], ['abc'], [0], list(range(1, 102))):
+            with self.subTest(ids=ids[:3]):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'ids': ids}, format='json'
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            '/api/recipes/favorite/', {'ids': [self.recipes[5].pk]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
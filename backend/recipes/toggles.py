@@ -0,0 +1,109 @@
+"""
+Избранное, корзина и подписки одним оператором: INSERT ... ON CONFLICT
+DO NOTHING и DELETE, оба с RETURNING. Возвращённые строки показывают,
+что реально изменилось, и по ним же обновляются счётчики, списки покупок
+и версии моделей — сигналы сырой SQL обходит.
+"""
+from django.db import connection, transaction
+
+from users.models import Follow, User
+from . import shopping_list
+from .conditional import bump_model_version_on_commit
+from .counters import increment_many
+from .models import Favorite, Recipe, ShoppingCart
+
+# Модель связи → счётчик рецепта.
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'carts_count',
+}
+
+INSERT_SQL = """
+INSERT INTO {table} (user_id, {column})
+SELECT %s, target.id FROM {targets} AS target
+WHERE target.id IN ({placeholders}){condition}
+ON CONFLICT (user_id, {column}) DO NOTHING
+RETURNING {column}
+"""
+
+DELETE_SQL = """
+DELETE FROM {table}
+WHERE user_id = %s AND {column} IN ({placeholders})
+RETURNING {column}
+"""
+
+
+def _execute(template, model, column, targets, user_id, ids,
+             condition='', params=()):
+    quote = connection.ops.quote_name
+    sql = template.format(
+        table=quote(model._meta.db_table),
+        targets=quote(targets._meta.db_table),
+        column=quote(column),
+        placeholders=', '.join(['%s'] * len(ids)),
+        condition=condition,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *ids, *params])
+        return {row[0] for row in cursor.fetchall()}
+
+
+@transaction.atomic
+def add_recipes(model, user_id, recipe_ids):
+    """
+    Добавляет рецепты в избранное или корзину (model) и возвращает id
+    добавленных. Несуществующие и уже добавленные рецепты пропускаются.
+    """
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return set()
+    added = _execute(
+        INSERT_SQL, model, 'recipe_id', Recipe, user_id, recipe_ids
+    )
+    if added:
+        increment_many(Recipe, added, RECIPE_COUNTERS[model])
+        if model is ShoppingCart:
+            shopping_list.add_recipes(user_id, added)
+        bump_model_version_on_commit(model)
+    return added
+
+
+@transaction.atomic
+def remove_recipes(model, user_id, recipe_ids):
+    """Убирает рецепты из избранного или корзины; id убранных."""
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return set()
+    removed = _execute(
+        DELETE_SQL, model, 'recipe_id', Recipe, user_id, recipe_ids
+    )
+    if removed:
+        increment_many(Recipe, removed, RECIPE_COUNTERS[model], -1)
+        if model is ShoppingCart:
+            shopping_list.remove_recipes(user_id, removed)
+        bump_model_version_on_commit(model)
+    return removed
+
+
+@transaction.atomic
+def follow(user_id, author_id):
+    """True, если подписка создана; на себя подписаться нельзя."""
+    created = _execute(
+        INSERT_SQL, Follow, 'author_id', User, user_id, [author_id],
+        condition=' AND target.id <> %s', params=[user_id],
+    )
+    if created:
+        increment_many(User, created, 'followers_count')
+        bump_model_version_on_commit(Follow)
+    return bool(created)
+
+
+@transaction.atomic
+def unfollow(user_id, author_id):
+    removed = _execute(
+        DELETE_SQL, Follow, 'author_id', User, user_id, [author_id]
+    )
+    if removed:
+        increment_many(User, removed, 'followers_count', -1)
+        bump_model_version_on_commit(Follow)
+    return bool(removed)
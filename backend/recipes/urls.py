@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
+from .asynchronous import async_read_patterns
 from .views import TagViewSet, IngredientViewSet, RecipeViewSet
 
 app_name = "recipes"
@@ -10,6 +11,11 @@ router.register("tags", TagViewSet)
 router.register("ingredients", IngredientViewSet)
 router.register("recipes", RecipeViewSet)
 
+ASYNC_READ_ROUTES = (
+    "tag-list", "tag-detail", "ingredient-list", "ingredient-detail",
+    "recipe-list", "recipe-detail",
+)
+
 urlpatterns = [
-    path("", include(router.urls)),
-]
\ No newline at end of file
+    path("", include(async_read_patterns(router.urls, ASYNC_READ_ROUTES))),
+]
@@ -1,75 +1,145 @@
-import io
+import os
 
-from rest_framework import viewsets, status
+from django.conf import settings
+from rest_framework import filters, viewsets, status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from django.http import FileResponse, HttpResponse
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.http import parse_etags
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models.aggregates import Sum
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 
+from users.models import Follow, User
 
-from .serializers import TagSerializer, IngredientSerializer, RecipeSerializer, FollowRecipeSerializer
-from .models import Tag, Ingredient, Recipe, Favorite, ShoppingCart, IngredientRecipe
+from . import shopping_list, toggles
+from .conditional import CachedResponseMixin, ConditionalGetMixin
+from .serializers import (TagSerializer, IngredientSerializer,
+                          RecipeSerializer, RecipeListSerializer,
+                          FollowRecipeSerializer, RecipeIdsSerializer,
+                          ShoppingListItemSerializer)
+from .models import (Tag, Ingredient, Recipe, Favorite, ShoppingCart,
+                     IngredientRecipe)
 from .filters import IngredientFilter, RecipeFilter
+from .ingredient_index import ingredient_index
+from .paginations import FeedPagination
 from .permissions import IsAuthenticatedOwnerOrReadOnly
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
+    etag_models = (Tag, )
     pagination_class = None
     permission_classes = (AllowAny, )
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
+    etag_models = (Ingredient, )
     pagination_class = None
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny, )
     filter_backends = (IngredientFilter, ) 
     search_fields = ("^name", )
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientFilter.search_param)
+        if name is None:
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(name))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    etag_models = (
+        Recipe, IngredientRecipe, Tag, Ingredient, User, Favorite,
+        ShoppingCart, Follow
+    )
+    etag_actions = ("list", "retrieve")
+    etag_per_user = True
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthenticatedOwnerOrReadOnly, )
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ("pub_date", "favorites_count", "carts_count")
+    pagination_class = FeedPagination
+
+    def get_queryset(self):
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
+
+    def get_serializer_class(self):
+        if self.action in ("list", "retrieve"):
+            return RecipeListSerializer
+        return RecipeSerializer
 
     def perform_create(self, serializer):   
         serializer.save(author=self.request.user)
 
     @staticmethod
     def favorite_shopping(request, pk, work_model, errors):
+        """
+        Добавление и удаление — по одному INSERT ... ON CONFLICT DO NOTHING
+        или DELETE ... RETURNING: ответ зависит от того, изменилась ли
+        строка, а не от предварительной проверки exists().
+        """
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound
         if request.method == "POST":
-            if work_model.objects.filter(
-                user=request.user,
-                recipe__id=pk
-            ).exists():
+            if not toggles.add_recipes(
+                    work_model, request.user.pk, [recipe_id]):
+                get_object_or_404(Recipe, id=recipe_id)
                 return Response(
                     {"errors": errors["recipe_in"]},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            recipe = get_object_or_404(Recipe, id=pk)
-            work_model.objects.create(user=request.user, recipe=recipe)
+            recipe = Recipe.objects.only(
+                "id", "name", "image", "image_variants", "cooking_time"
+            ).get(pk=recipe_id)
             serializer = FollowRecipeSerializer(
                 recipe,
                 context={"request": request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        recipe = work_model.objects.filter(user=request.user, recipe__id=pk)
-        if recipe.exists():
-            work_model.objects.filter(user=request.user, recipe__id=pk).delete()
+        if toggles.remove_recipes(work_model, request.user.pk, [recipe_id]):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {"errors": errors["recipe_not_in"]},
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @staticmethod
+    def batch(request, work_model):
+        """
+        Пакетная версия: {"ids": [...]} добавляется (POST) или убирается
+        (DELETE) одним оператором. Несуществующие, уже добавленные
+        и отсутствующие рецепты попадают в skipped.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = set(serializer.validated_data["ids"])
+        if request.method == "POST":
+            key = "added"
+            changed = toggles.add_recipes(
+                work_model, request.user.pk, recipe_ids
+            )
+        else:
+            key = "removed"
+            changed = toggles.remove_recipes(
+                work_model, request.user.pk, recipe_ids
+            )
+        return Response({
+            key: sorted(changed),
+            "skipped": sorted(recipe_ids - changed),
+        })
+
     @action(
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
@@ -102,31 +172,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
             }
         )
 
+    @action(
+        methods=["post", "delete"],
+        permission_classes=[IsAuthenticated],
+        detail=False,
+        url_path="favorite",
+        url_name="favorite-batch",
+    )
+    def favorite_batch(self, request):
+        return self.batch(request, Favorite)
+
+    @action(
+        methods=["post", "delete"],
+        permission_classes=[IsAuthenticated],
+        detail=False,
+        url_path="shopping_cart",
+        url_name="shopping-cart-batch",
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch(request, ShoppingCart)
+
+    @action(
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        detail=False
+    )
+    def shopping_list(self, request):
+        serializer = ShoppingListItemSerializer(
+            shopping_list.get_items(request.user), many=True
+        )
+        return Response(serializer.data)
+
+    def perform_content_negotiation(self, request, force=False):
+        if self.action == "download_shopping_cart":
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     @action(
         methods=["get"],
         permission_classes=[IsAuthenticated],
         detail=False
     )
     def download_shopping_cart(self, request):
-        ingredientrecipe_list = IngredientRecipe.objects.filter(
-            recipe__carts__user=request.user
-        ).values("ingredient__name", "ingredient__measurement_unit").annotate(
-            sum_amount=Sum("amount")
-        )
-        content = ''
-        if ingredientrecipe_list:
-            for index, item in enumerate(ingredientrecipe_list, start=1):
-                content += (
-                    f'{index}. {item["ingredient__name"]} - '
-                    f'{item["sum_amount"]} '
-                    f'{item["ingredient__measurement_unit"]}'
-                )
-        else:
-            content += ('Список покупок пуст')
-        return HttpResponse(
-            content,
-            content_type='text/plai, charset=utf8',
-            headers={
-                'Content-Disposition': 'attachment; filename=shopping_cart.txt'
-            }
+        file_format = request.query_params.get("format", "txt")
+        if file_format not in shopping_list.FORMATS:
+            return Response(
+                {"errors": "Доступные форматы: " + ", ".join(
+                    shopping_list.FORMATS
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        etag = shopping_list.get_etag(request.user, file_format)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return HttpResponseNotModified(headers={"ETag": etag})
+        render, content_type = shopping_list.FORMATS[file_format]
+        headers = {
+            "Content-Disposition": (
+                f"attachment; filename=shopping_cart.{file_format}"
+            ),
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+        }
+        if settings.USE_X_ACCEL_REDIRECT:
+            name = shopping_list.export_file(
+                request.user, file_format, etag
+            )
+            headers["X-Accel-Redirect"] = (
+                settings.PROTECTED_MEDIA_URL + name.replace(os.sep, "/")
+            )
+            return HttpResponse(content_type=content_type, headers=headers)
+        return StreamingHttpResponse(
+            render(shopping_list.get_rows(request.user)),
+            content_type=content_type,
+            headers=headers,
         )
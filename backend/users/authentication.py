@@ -0,0 +1,239 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+ENTRY_KEY = 'auth:token:{}'
+VERSION_KEY = 'auth:token:{}:version'
+STATS_KEY = 'auth:token:stats:{}'
+STATS_FIELDS = ('local_hits', 'shared_hits', 'misses', 'stale')
+STATS_FLUSH_EVERY = 100
+
+Entry = namedtuple('Entry', 'user token version expires')
+
+
+def get_cache():
+    return caches[settings.TOKEN_AUTH_CACHE_ALIAS]
+
+
+def digest(key):
+    # Ключ токена — это пароль: в кэш и в память кладём только хэш.
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def add_version(cache, name):
+    """
+    Заводит версию токена, которого ещё нет в кэше, и возвращает её или
+    None, если версию успели записать другие (например, сброс токена
+    во время чтения из базы). Пишется только после успешной загрузки,
+    поэтому неверные ключи не оставляют записей, а время жизни конечно.
+    """
+    # Как и версии карточек рецептов: потерянная кэшем версия
+    # не должна совпасть с уже записанной.
+    version = time.time_ns()
+    if cache.add(
+        VERSION_KEY.format(name), version, settings.TOKEN_AUTH_CACHE_TTL
+    ):
+        return version
+    return None
+
+
+def invalidate_tokens(keys):
+    """
+    Сбрасывает закэшированных пользователей токенов во всех процессах:
+    меняется версия, с которой сверяется каждое попадание.
+    """
+    # Записи старше TOKEN_AUTH_CACHE_TTL уже не используются, поэтому
+    # и новой версии хватает того же времени жизни.
+    now = time.time_ns()
+    get_cache().set_many(
+        {VERSION_KEY.format(digest(key)): now for key in keys},
+        settings.TOKEN_AUTH_CACHE_TTL,
+    )
+    for key in keys:
+        token_cache.discard(digest(key))
+
+
+def invalidate_tokens_on_commit(keys):
+    # До коммита параллельный запрос ещё прочитает из базы старую строку
+    # и закэширует её уже с новой версией.
+    keys = list(keys)
+    if keys:
+        transaction.on_commit(lambda: invalidate_tokens(keys))
+
+
+def invalidate_user(user_id):
+    """Для изменений пользователя в обход сигналов (QuerySet.update)."""
+    invalidate_tokens_on_commit(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    )
+
+
+class TokenCache:
+    """
+    LRU «токен → пользователь» в памяти процесса с ограниченным временем
+    жизни. Каждое попадание сверяется с версией токена в кэше
+    TOKEN_AUTH_CACHE_ALIAS, поэтому выход, смена пароля или блокировка
+    видны всем воркерам сразу; для нескольких воркеров этот кэш должен
+    быть общим (см. foodgram/caches.py).
+    При TOKEN_AUTH_SHARED_CACHE промах в памяти сначала ищется в общем
+    кэше и только затем в базе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = dict.fromkeys(STATS_FIELDS, 0)
+        self._unflushed = dict.fromkeys(STATS_FIELDS, 0)
+
+    def authenticate(self, key, load):
+        """(user, token) по ключу; load(key) читает их из базы."""
+        name = digest(key)
+        cache = get_cache()
+        entry = self._get(name)
+        if entry is not None:
+            if cache.get(VERSION_KEY.format(name)) == entry.version:
+                self._count('local_hits')
+                return self._copy(entry)
+            self.discard(name)
+            self._count('stale')
+        if settings.TOKEN_AUTH_SHARED_CACHE:
+            found = cache.get_many(
+                [ENTRY_KEY.format(name), VERSION_KEY.format(name)]
+            )
+            shared = found.get(ENTRY_KEY.format(name))
+            if shared is not None:
+                user, token, version = shared
+                if version == found.get(VERSION_KEY.format(name)):
+                    self._count('shared_hits')
+                    return self._copy(self._put(name, user, token, version))
+                self._count('stale')
+        # Версия читается до базы: если токен сбросят, пока мы читаем,
+        # запись окажется устаревшей при первой же проверке.
+        version = cache.get(VERSION_KEY.format(name))
+        user, token = load(key)
+        self._count('misses')
+        if version is None:
+            version = add_version(cache, name)
+            if version is None:
+                return user, token
+        if settings.TOKEN_AUTH_SHARED_CACHE:
+            cache.set(
+                ENTRY_KEY.format(name), (user, token, version),
+                settings.TOKEN_AUTH_CACHE_TTL,
+            )
+        return self._copy(self._put(name, user, token, version))
+
+    def _get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                del self._entries[name]
+                return None
+            self._entries.move_to_end(name)
+            return entry
+
+    def _put(self, name, user, token, version):
+        entry = Entry(
+            user, token, version,
+            time.monotonic() + settings.TOKEN_AUTH_CACHE_TTL,
+        )
+        with self._lock:
+            self._entries[name] = entry
+            self._entries.move_to_end(name)
+            while len(self._entries) > settings.TOKEN_AUTH_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return entry
+
+    def discard(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _copy(entry):
+        # Запросы меняют request.user (например, set_password), поэтому
+        # каждый получает свою копию.
+        return copy.copy(entry.user), copy.copy(entry.token)
+
+    def _count(self, field):
+        with self._lock:
+            self._stats[field] += 1
+            self._unflushed[field] += 1
+            if sum(self._unflushed.values()) < STATS_FLUSH_EVERY:
+                return
+            unflushed = self._unflushed
+            self._unflushed = dict.fromkeys(STATS_FIELDS, 0)
+        flush_stats(unflushed)
+
+    def local_stats(self):
+        with self._lock:
+            return with_ratio(dict(self._stats), size=len(self._entries))
+
+
+def flush_stats(counts):
+    cache = get_cache()
+    for field, value in counts.items():
+        if not value:
+            continue
+        try:
+            cache.incr(STATS_KEY.format(field), value)
+        except ValueError:
+            cache.add(STATS_KEY.format(field), value, None)
+
+
+def with_ratio(stats, **extra):
+    total = sum(stats[field] for field in STATS_FIELDS if field != 'stale')
+    hits = stats['local_hits'] + stats['shared_hits']
+    stats['hit_ratio'] = round(hits / total, 4) if total else 0.0
+    stats.update(extra)
+    return stats
+
+
+def get_stats():
+    """Счётчики всех процессов (сбрасываются в кэш пачками)."""
+    found = get_cache().get_many(
+        [STATS_KEY.format(field) for field in STATS_FIELDS]
+    )
+    return with_ratio({
+        field: found.get(STATS_KEY.format(field), 0)
+        for field in STATS_FIELDS
+    })
+
+
+def reset_stats():
+    get_cache().delete_many(
+        [STATS_KEY.format(field) for field in STATS_FIELDS]
+    )
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса Token JOIN User на каждый вызов API:
+    пользователь берётся из token_cache. Выключается TOKEN_AUTH_CACHE.
+    С кэшем в памяти процесса годится только для одного процесса: check
+    --deploy об этом предупреждает, а gunicorn не запустит несколько
+    воркеров.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_AUTH_CACHE:
+            return super().authenticate_credentials(key)
+        return token_cache.authenticate(
+            key, super().authenticate_credentials
+        )
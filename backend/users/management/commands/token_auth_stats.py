@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodgram.caches import is_process_local
+from users import authentication
+
+
+class Command(BaseCommand):
+    help = 'Статистика кэша аутентификации по токенам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        if is_process_local(settings.TOKEN_AUTH_CACHE_ALIAS):
+            self.stdout.write(
+                f'кэш {settings.TOKEN_AUTH_CACHE_ALIAS} в памяти процесса: '
+                'счётчики воркеров отсюда не видны'
+            )
+            return
+        stats = authentication.get_stats()
+        self.stdout.write(
+            f"из памяти: {stats['local_hits']}, "
+            f"из общего кэша: {stats['shared_hits']}, "
+            f"из базы: {stats['misses']}, устаревших: {stats['stale']}, "
+            f"доля попаданий: {stats['hit_ratio']:.2%}"
+        )
+        if options['reset']:
+            authentication.reset_stats()
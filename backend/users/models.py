@@ -34,6 +34,12 @@ class User(AbstractUser):
     )
     is_superuser = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False
+    )
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     USERNAME_FIELD = 'email'
 
@@ -91,3 +97,9 @@ class Follow(models.Model):
                 name='unique_user_follow'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx'
+            )
+        ]
@@ -1,5 +1,4 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
 from recipes.serializers import FollowRecipeSerializer
@@ -30,6 +29,8 @@ class UserSerializer(serializers.ModelSerializer):
             "last_name",
             "password",
             "is_subscribed",
+            "recipes_count",
+            "followers_count",
         )
         extra_kwargs = {
             "password": {
@@ -49,17 +50,16 @@ class UserSerializer(serializers.ModelSerializer):
 class FollowSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True
-    )
 
     def get_recipes(self, obj):
         request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
-        author = get_object_or_404(User, id=obj.pk)
-        recipes = author.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, "recipe_previews"):
+            recipes = obj.recipe_previews
+        else:
+            limit = request.GET.get("recipes_limit")
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = FollowRecipeSerializer(
             recipes,
             many=True,
@@ -70,6 +70,8 @@ class FollowSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         if self.context["request"].user.is_anonymous:
             return False
         return Follow.objects.filter(
@@ -88,4 +90,5 @@ class FollowSerializer(serializers.ModelSerializer):
             "is_subscribed",
             "recipes",
             "recipes_count",
+            "followers_count",
         )
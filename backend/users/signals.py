@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.counters import increment
+
+from .authentication import invalidate_tokens_on_commit, invalidate_user
+from .models import Follow, User
+
+
+@receiver(post_save, sender=Follow)
+def count_follower_added(sender, instance, created, **kwargs):
+    if created:
+        increment(User, instance.author_id, 'followers_count')
+
+
+@receiver(post_delete, sender=Follow)
+def count_follower_removed(sender, instance, **kwargs):
+    increment(User, instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    # Выход через djoser (token/logout) удаляет токен, как и удаление
+    # пользователя каскадом.
+    invalidate_tokens_on_commit([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_changed_user(sender, instance, created, **kwargs):
+    # Смена пароля, блокировка (is_active) и правка профиля.
+    if not created:
+        invalidate_user(instance.pk)
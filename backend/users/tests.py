@@ -1,3 +1,97 @@
-from django.test import TestCase
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from foodgram.caches import process_local_caches
+from .authentication import VERSION_KEY, digest, token_cache
+from .models import User
+
+
+class TokenCacheTest(APITestCase):
+    """Токен читается из базы при первом запросе, сбросы видны сразу."""
+    password = 'Secret-123'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password=cls.password, first_name='reader', last_name='reader',
+        )
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    def login(self):
+        response = self.client.post('/api/auth/token/login/', {
+            'email': self.user.email, 'password': self.password,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        key = response.data['auth_token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return key
+
+    def token_queries(self, path='/api/users/me/'):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = Token._meta.db_table
+        return sum(table in query['sql'] for query in captured)
+
+    def test_token_is_read_once(self):
+        self.login()
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 0)
+
+    @override_settings(TOKEN_AUTH_CACHE=False)
+    def test_disabled_cache_reads_every_time(self):
+        self.login()
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 1)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE=True)
+    def test_new_process_finds_token_in_shared_cache(self):
+        self.login()
+        self.token_queries()
+        token_cache.clear()
+        self.assertEqual(self.token_queries(), 0)
+
+    def test_logout_invalidates_cached_token(self):
+        self.login()
+        self.token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.login()
+        self.token_queries()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_token_leaves_no_version(self):
+        key = 'x' * 40
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(
+            caches['default'].get(VERSION_KEY.format(digest(key)))
+        )
+
+    def test_process_local_cache_is_reported_while_enabled(self):
+        self.assertIn('версии токенов', process_local_caches()['default'])
+        with override_settings(TOKEN_AUTH_CACHE=False):
+            self.assertNotIn(
+                'версии токенов', process_local_caches()['default']
+            )
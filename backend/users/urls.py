@@ -1,20 +1,26 @@
 from django.urls import include, path
+from rest_framework.routers import SimpleRouter
 
-from users.views import SubscriptionsView, SubsribeView
+from recipes.asynchronous import async_read_patterns
+from users.views import SubscriptionsView, SubsribeView, UserViewSet
 
 app_name = "users"
 
-urlpatterns = [
+router = SimpleRouter()
+router.register("users", UserViewSet)
+
+urlpatterns = async_read_patterns([
     path(
         "users/subscriptions/",
         SubscriptionsView.as_view(),
         name="subscriptions"
     ),
+], ("subscriptions",)) + [
     path(
         "users/<int:pk>/subscribe/",
         SubsribeView.as_view(),
         name="subscribe"
     ),
-    path("", include("djoser.urls")),
+    path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken")),
 ]
\ No newline at end of file
@@ -1,21 +1,72 @@
+from django.db.models import Value
 from django.shortcuts import get_object_or_404
-from rest_framework import generics, permissions, status
+from rest_framework import filters, generics, permissions, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from djoser.views import UserViewSet as DjoserUserViewSet
+
+from recipes import toggles
+from recipes.conditional import ConditionalGetMixin
+from recipes.models import Recipe
+from recipes.paginations import SubscriptionFeedPagination
 
 from .models import Follow, User
 from .serializers import FollowSerializer, UserSerializer
 
 
-class SubscriptionsView(generics.ListAPIView):
+class UserViewSet(ConditionalGetMixin, DjoserUserViewSet):
+    etag_models = (User, Follow, Recipe)
+    etag_actions = ("list", "retrieve", "me")
+    etag_per_user = True
+
+    def get_instance(self):
+        # request.user может прийти из кэша аутентификации, а счётчики
+        # рецептов и подписчиков меняются через update() без сигналов.
+        return User.objects.get(pk=self.request.user.pk)
+
+
+class SubscriptionsView(ConditionalGetMixin, generics.ListAPIView):
     queryset = User.objects.all()
+    etag_models = (User, Follow, Recipe)
+    etag_per_user = True
     permission_classes = [permissions.IsAuthenticated, ]
     serializer_class = FollowSerializer
+    pagination_class = SubscriptionFeedPagination
+    filter_backends = (filters.OrderingFilter, )
+    ordering_fields = ("username", "recipes_count", "followers_count")
 
     def get_queryset(self):
         user = self.request.user
-        return User.objects.filter(following__user=user)
+        return User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True)
+        )
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params["recipes_limit"])
+        except (KeyError, ValueError):
+            return None
+        return limit if limit >= 0 else None
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.attach_recipes(page)
+        return page
+
+    def attach_recipes(self, authors):
+        previews = {author.pk: [] for author in authors}
+        recipes = Recipe.objects.latest_per_author(
+            previews, self.get_recipes_limit()
+        ).only(
+            "id", "name", "image", "image_variants", "cooking_time",
+            "author_id",
+        )
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipe_previews = previews[author.pk]
 
 
 class SubsribeView(generics.CreateAPIView, generics.DestroyAPIView):
@@ -25,20 +76,19 @@ class SubsribeView(generics.CreateAPIView, generics.DestroyAPIView):
 
     def post(self, request, pk):
         user = request.user
-        author = get_object_or_404(User, id=pk)
-        if author == user:
+        if pk == user.pk:
             return Response(
                 {"errors": "Вы не можете подписываться на самого себя"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        if Follow.objects.filter(user=user, author=author).exists():
+        if not toggles.follow(user.pk, pk):
+            get_object_or_404(User, id=pk)
             return Response(
                 {"errors": "Вы уже подписаны на данного пользователя"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        Follow.objects.get_or_create(user=user, author=author)
-        follow = User.objects.filter(username=author).first()
-        serializer = FollowSerializer(follow, context={"request": request})
+        author = User.objects.annotate(is_subscribed=Value(True)).get(pk=pk)
+        serializer = FollowSerializer(author, context={"request": request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
@@ -48,17 +98,14 @@ class SubsribeView(generics.CreateAPIView, generics.DestroyAPIView):
     )
     def delete(self, request, pk):
         user = request.user
-        author = get_object_or_404(User, id=pk)
-        if user == author:
+        if pk == user.pk:
             return Response(
                 {"errors": "Вы не можете отписываться от самого себя"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        follow = Follow.objects.filter(user=user, author=author)
-        if follow.exists():
-            follow.delete()
+        if toggles.unfollow(user.pk, pk):
             return Response(status=status.HTTP_204_NO_CONTENT)
-
+        get_object_or_404(User, id=pk)
         return Response(
             {"errors": "Вы уже отписались"}, status=status.HTTP_400_BAD_REQUEST
         )